@@ -1,9 +1,18 @@
+from contextlib import closing
 import os
-from typing import List
+from typing import Dict, Iterable, List, Sequence
 
+import numpy as np
 import pandas as pd
 import psycopg2
 
+from analysis import snapshot
+
+SCORE_COLUMNS = ["vader_score_title", "roberta_score_title", "vader_score_post_text", "roberta_score_post_text"]
+
+LABELS = ["negative", "neutral", "positive"]
+LABEL_VALUES = np.array([-1, 0, 1], dtype=np.int8)
+
 
 def pg_conn():
     """Get a Postgres connection."""
@@ -13,12 +22,48 @@ def pg_conn():
     return psycopg2.connect(user=PG_USER, password=PG_PASSWORD, database=PG_DATABASE)
 
 
-def get_data(symbols: List[str]) -> pd.DataFrame:
+def encode_labels(labels: Iterable) -> pd.arrays.IntegerArray:
+    """Encode sentiment labels as -1, 0 and 1, masking missing or unknown labels.
+
+    :param labels: The labels negative, neutral or positive
+    :return: A nullable Int8 array
+    """
+    codes = pd.Categorical(labels, categories=LABELS).codes
+    return pd.arrays.IntegerArray(LABEL_VALUES[codes], codes == -1)
+
+
+def _build_post_frame(columns: Dict[str, Sequence]) -> pd.DataFrame:
+    """Build a typed DataFrame of posts from raw column values.
+
+    :param columns: A mapping of column names to values
+    :return: A DataFrame of post information
+    """
+    data = pd.DataFrame({
+        "id": pd.Series(columns["id"], dtype="string"),
+        "author": pd.Categorical(columns["author"]),
+        "created_at": pd.to_datetime(pd.Series(columns["created_at"], dtype="object")),
+        "symbol": pd.Categorical(columns["symbol"])
+    })
+    for column in SCORE_COLUMNS:
+        data[column] = encode_labels(columns[column])
+    data["created_date"] = data["created_at"].dt.normalize()
+
+    return data
+
+
+def get_data(symbols: List[str], use_snapshot: bool = True) -> pd.DataFrame:
     """Get data for a particular stock symbol.
 
+    A post tagged with several of the symbols appears once per symbol, in a row with that symbol.
+
     :param symbols: The list of stock symbols to grab data for
+    :param use_snapshot: Whether to read from the local snapshot when it is fresh
     :return: A DataFrame of post information
     """
+    if use_snapshot and snapshot.is_fresh(dataset="posts"):
+        data = snapshot.read_posts(symbols, ["id", "author", "created_at"] + SCORE_COLUMNS + ["symbol"])
+        return _build_post_frame({column: data[column] for column in data.columns})
+
     query = """
             SELECT 
                 posts.id, 
@@ -27,27 +72,34 @@ def get_data(symbols: List[str]) -> pd.DataFrame:
                 vader_score_title,
                 roberta_score_title,
                 vader_score_post_text,
-                roberta_score_post_text
+                roberta_score_post_text,
+                xr.symbol
             FROM posts
             INNER JOIN posts_stocks_xref AS xr
                 ON posts.id = xr.id
             WHERE xr.symbol IN %s
             """
-    conn = pg_conn()
-    cur = conn.cursor()
-    cur.execute(query, (tuple(symbols), ))
+    with closing(pg_conn()) as conn:
+        cur = conn.cursor()
+        cur.execute(query, (tuple(symbols), ))
 
-    col_names = [desc[0] for desc in cur.description]
-    results = cur.fetchall()
+        col_names = [desc[0] for desc in cur.description]
+        columns = dict(zip(col_names, zip(*cur.fetchall()))) or {name: () for name in col_names}
 
-    data = pd.DataFrame(results, columns=col_names)
-    data["created_date"] = pd.to_datetime(data["created_at"]).dt.date
+    return _build_post_frame(columns)
 
-    return data
 
+def get_total_posts_per_day(use_snapshot: bool = True) -> pd.DataFrame:
+    """Get the total number of posts per day.
+
+    :param use_snapshot: Whether to read from the local snapshot when it is fresh
+    :return: A DataFrame of daily post counts
+    """
+    if use_snapshot and snapshot.is_fresh(dataset="post_counts.parquet"):
+        data = snapshot.read_post_counts()
+        data["created_date"] = pd.to_datetime(data["created_date"])
+        return data
 
-def get_total_posts_per_day() -> pd.DataFrame:
-    """Get the total number of posts per day."""
     query = """
             SELECT 
                 COUNT(id) as total_num_posts, 
@@ -56,14 +108,60 @@ def get_total_posts_per_day() -> pd.DataFrame:
             GROUP BY created_date
             """
 
-    conn = pg_conn()
-    cur = conn.cursor()
-    cur.execute(query)
+    with closing(pg_conn()) as conn:
+        cur = conn.cursor()
+        cur.execute(query)
 
-    col_names = [desc[0] for desc in cur.description]
-    results = cur.fetchall()
+        col_names = [desc[0] for desc in cur.description]
+        results = cur.fetchall()
 
-    return pd.DataFrame(results, columns=col_names)
+    data = pd.DataFrame(results, columns=col_names)
+    data["created_date"] = pd.to_datetime(data["created_date"])
+
+    return data
+
+
+def get_daily_sentiment(
+        symbols: List[str],
+        model: str = "roberta",
+        score_column: str = "title"
+) -> pd.DataFrame:
+    """Get precomputed daily sentiment aggregates for a set of stock symbols.
+
+    Aggregates are combined across the symbols, with the mean score weighted by the number of scored posts.
+
+    :param symbols: The list of stock symbols to grab data for
+    :param model: The sentiment model, either vader or roberta
+    :param score_column: The scored text, either title or post_text
+    :return: A DataFrame of daily post counts, label counts and mean scores
+    """
+    query = """
+            SELECT
+                created_date,
+                SUM(num_posts) AS num_posts,
+                SUM(num_negative) AS num_negative,
+                SUM(num_neutral) AS num_neutral,
+                SUM(num_positive) AS num_positive,
+                SUM(mean_score * (num_negative + num_neutral + num_positive))
+                    / NULLIF(SUM(num_negative + num_neutral + num_positive), 0) AS mean_score
+            FROM daily_sentiment
+            WHERE symbol IN %s
+            AND model = %s
+            AND score_column = %s
+            GROUP BY created_date
+            ORDER BY created_date
+            """
+    with closing(pg_conn()) as conn:
+        cur = conn.cursor()
+        cur.execute(query, (tuple(symbols), model, score_column))
+
+        col_names = [desc[0] for desc in cur.description]
+        results = cur.fetchall()
+
+    data = pd.DataFrame(results, columns=col_names)
+    data["created_date"] = pd.to_datetime(data["created_date"])
+
+    return data
 
 
 def prepare_sentiment_scores(
@@ -72,16 +170,15 @@ def prepare_sentiment_scores(
 ) -> pd.DataFrame:
     """Prepare sentiment scores for analysis.
 
+    Labels are encoded as -1, 0 and 1. Missing labels are masked rather than dropped,
+    so they are skipped by means and counts without losing the rest of the row.
+
     :param data: A DataFrame of post data
     :param score_column: The name of the column containing sentiment scores
     :return: A DataFrame containing prepared sentiment scores
     """
-    data[score_column] = data[score_column].astype("category")
-    data[score_column] = data[score_column].replace(
-        to_replace=["negative", "neutral", "positive"], value=[-1, 0, 1]
-    )
-    data[score_column] = data[score_column].astype("float")
-    data = data.dropna()
+    if not pd.api.types.is_integer_dtype(data[score_column]):
+        data[score_column] = encode_labels(data[score_column])
 
     return data
 
@@ -0,0 +1,261 @@
+"""Keeps a local Parquet snapshot of posts, comment scores and symbol tags for offline analysis.
+
+Posts and comments are partitioned by created_date and symbol. Run ``python -m analysis.snapshot``
+to create or refresh the snapshot; the loaders in analysis.post read from it while it is fresh.
+"""
+import argparse
+from contextlib import closing
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+from typing import Generator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshot")
+
+PARTITIONING = ds.partitioning(pa.schema([("created_date", pa.date32()), ("symbol", pa.string())]), flavor="hive")
+
+POSTS_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("author", pa.string()),
+    ("created_at", pa.timestamp("us")),
+    ("vader_score_title", pa.string()),
+    ("roberta_score_title", pa.string()),
+    ("vader_score_post_text", pa.string()),
+    ("roberta_score_post_text", pa.string()),
+    ("created_date", pa.date32()),
+    ("symbol", pa.string())
+])
+
+COMMENTS_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("parent_id", pa.string()),
+    ("author", pa.string()),
+    ("created_at", pa.timestamp("us")),
+    ("vader_score_body", pa.string()),
+    ("roberta_score_body", pa.string()),
+    ("created_date", pa.date32()),
+    ("symbol", pa.string())
+])
+
+
+def _read_manifest(path: str) -> dict:
+    """Read the manifest describing the last export.
+
+    :param path: The snapshot directory
+    :return: The manifest, or an empty dict if there is no snapshot
+    """
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def is_fresh(
+        path: str = SNAPSHOT_DIR,
+        max_age: timedelta = timedelta(days=1),
+        dataset: Optional[str] = None
+) -> bool:
+    """Check whether the snapshot was refreshed recently enough to be read instead of Postgres.
+
+    An export that found no rows writes no dataset, so a missing dataset counts as stale.
+
+    :param path: The snapshot directory
+    :param max_age: The oldest export considered fresh
+    :param dataset: The dataset that will be read, such as posts or post_counts.parquet
+    :return: True if the snapshot, and the dataset if one is given, exist and are fresh
+    """
+    if dataset is not None and not os.path.exists(os.path.join(path, dataset)):
+        return False
+
+    exported_at = _read_manifest(path).get("exported_at")
+    return exported_at is not None and datetime.utcnow() - datetime.fromisoformat(exported_at) <= max_age
+
+
+def _batches(
+        conn,
+        query: str,
+        params: tuple,
+        schema: pa.Schema,
+        batch_size: int
+) -> Generator[pa.RecordBatch, None, None]:
+    """Stream query results as Arrow record batches through a server-side cursor.
+
+    :param conn: An open Postgres connection
+    :param query: The query to execute, selecting the schema's columns in order
+    :param params: The parameters of the query
+    :param schema: The schema of the batches
+    :param batch_size: The number of rows per batch
+    :return: A generator of record batches
+    """
+    with conn.cursor(name="snapshot_export") as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        while rows := cur.fetchmany(batch_size):
+            columns = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+
+
+def _export(conn, query: str, params: tuple, schema: pa.Schema, base_dir: str, batch_size: int) -> None:
+    """Write query results into a partitioned dataset, replacing the partitions they touch.
+
+    :param conn: An open Postgres connection
+    :param query: The query to execute, selecting the schema's columns in order
+    :param params: The parameters of the query
+    :param schema: The schema of the dataset
+    :param base_dir: The directory of the dataset
+    :param batch_size: The number of rows fetched at a time
+    :return: None
+    """
+    reader = pa.RecordBatchReader.from_batches(schema, _batches(conn, query, params, schema, batch_size))
+    ds.write_dataset(
+        reader,
+        base_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        existing_data_behavior="delete_matching"
+    )
+    conn.commit()
+
+
+def export_snapshot(
+        path: str = SNAPSHOT_DIR,
+        full: bool = False,
+        lookback: timedelta = timedelta(hours=1),
+        batch_size: int = 50000
+) -> None:
+    """Export posts, comment scores and symbol tags from Postgres to the snapshot.
+
+    Incremental exports rewrite every day with a post or comment whose updated_at is after the last
+    export started, which picks up new rows, scores and tags whatever day they belong to.
+
+    :param path: The snapshot directory
+    :param full: Whether to rewrite the whole snapshot
+    :param lookback: How far before the last export started to look for changes, covering transactions that were still open
+    :param batch_size: The number of rows fetched at a time
+    :return: None
+    """
+    from analysis.post import pg_conn
+
+    started_at = _read_manifest(path).get("started_at")
+    since = None
+    if started_at is not None and not full:
+        since = datetime.fromisoformat(started_at) - lookback
+
+    posts_query = """
+                  SELECT
+                      posts.id,
+                      author,
+                      created_at,
+                      vader_score_title,
+                      roberta_score_title,
+                      vader_score_post_text,
+                      roberta_score_post_text,
+                      created_at::date AS created_date,
+                      xr.symbol
+                  FROM posts
+                  INNER JOIN posts_stocks_xref AS xr
+                      ON posts.id = xr.id
+                  WHERE (%s::timestamp IS NULL OR created_at::date IN (
+                      SELECT DISTINCT created_at::date FROM posts WHERE updated_at >= %s
+                  ))
+                  """
+    comments_query = """
+                     SELECT
+                         comments.id,
+                         parent_id,
+                         author,
+                         created_at,
+                         vader_score_body,
+                         roberta_score_body,
+                         created_at::date AS created_date,
+                         xr.symbol
+                     FROM comments
+                     INNER JOIN comments_stocks_xref AS xr
+                         ON comments.id = xr.id
+                     WHERE (%s::timestamp IS NULL OR created_at::date IN (
+                         SELECT DISTINCT created_at::date FROM comments WHERE updated_at >= %s
+                     ))
+                     """
+    counts_query = """
+                   SELECT
+                       COUNT(id) as total_num_posts,
+                       created_at::date AS created_date
+                   FROM posts
+                   GROUP BY created_date
+                   """
+
+    with closing(pg_conn()) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT NOW()::timestamp")
+        export_started = cur.fetchone()[0]
+        conn.commit()
+
+        _export(conn, posts_query, (since, since), POSTS_SCHEMA, os.path.join(path, "posts"), batch_size)
+        _export(conn, comments_query, (since, since), COMMENTS_SCHEMA, os.path.join(path, "comments"), batch_size)
+
+        cur.execute(counts_query)
+        counts = pd.DataFrame(cur.fetchall(), columns=["total_num_posts", "created_date"])
+        pq.write_table(pa.Table.from_pandas(counts, preserve_index=False), os.path.join(path, "post_counts.parquet"))
+
+    manifest = {
+        "exported_at": datetime.utcnow().isoformat(),
+        "started_at": export_started.isoformat()
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    logging.info(f"Exported snapshot to {path} with changes since {since or 'the beginning'}")
+
+
+def read_posts(symbols: List[str], columns: List[str], path: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Read the posts tagged with any of a set of symbols from the snapshot.
+
+    Only the requested columns and the matching symbol partitions are read.
+
+    :param symbols: The list of stock symbols to grab data for
+    :param columns: The columns to read
+    :param path: The snapshot directory
+    :return: A DataFrame of post information
+    """
+    dataset = ds.dataset(os.path.join(path, "posts"), format="parquet", partitioning=PARTITIONING)
+    return dataset.to_table(columns=columns, filter=ds.field("symbol").isin(symbols)).to_pandas()
+
+
+def read_post_counts(path: str = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Read the total number of posts per day from the snapshot.
+
+    :param path: The snapshot directory
+    :return: A DataFrame of daily post counts
+    """
+    return pq.read_table(os.path.join(path, "post_counts.parquet")).to_pandas()
+
+
+def main(argv: Optional[List[str]] = None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Export a Parquet snapshot of posts for offline analysis.")
+    parser.add_argument("--path", default=SNAPSHOT_DIR, help="The snapshot directory")
+    parser.add_argument("--full", action="store_true", help="Rewrite the whole snapshot")
+    parser.add_argument("--lookback-hours", type=float, default=1,
+                        help="The number of hours before the last export to look for changes")
+    args = parser.parse_args(argv)
+
+    export_snapshot(args.path, args.full, timedelta(hours=args.lookback_hours))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,108 @@
-from typing import List
+from datetime import datetime, timedelta
+import glob
+import os
+from typing import List, Optional, Sequence
 
 import pandas as pd
+import pyarrow.parquet as pq
 
+DATA_DIR = "./data"
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
 
-def get_data(symbols: List[str], window: int = 5) -> pd.DataFrame:
+FEATURES = ("Open", "High", "Low", "Close", "Volume")
+
+
+def _cache_path(file_name: str) -> str:
+    """Get the path of the cached copy of a CSV for its current modification time.
+
+    :param file_name: The path of the CSV
+    :return: The path of the Parquet cache file
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{os.stat(file_name).st_mtime_ns}.parquet")
+
+
+def _load_symbol(
+        symbol: str,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """Load the price history of a symbol, parsing its CSV only when it has changed.
+
+    :param symbol: The stock symbol
+    :param start: The first date to load, or None for the start of the history
+    :param end: The date to stop loading before, or None for the end of the history
+    :return: A DataFrame of historical stock information sorted by date
+    """
+    file_name = os.path.join(DATA_DIR, f"{symbol.lower()}_us_d.csv")
+    cache_path = _cache_path(file_name)
+
+    if not os.path.exists(cache_path):
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+        for stale_path in glob.glob(os.path.join(CACHE_DIR, f"{stem}-*.parquet")):
+            os.remove(stale_path)
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        prices = pd.read_csv(file_name, parse_dates=["Date"]).sort_values("Date")
+        prices.to_parquet(cache_path, index=False)
+
+    filters = []
+    if start is not None:
+        filters.append(("Date", ">=", start))
+    if end is not None:
+        filters.append(("Date", "<", end))
+
+    data = pq.read_table(cache_path, filters=filters or None).to_pandas()
+    data["symbol"] = symbol
+
+    return data
+
+
+def get_data(
+        symbols: List[str],
+        window: int = 5,
+        lead: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        features: Sequence[str] = FEATURES
+) -> pd.DataFrame:
     """Prepare stock data for analysis.
 
+    Each Rolling_ feature is the mean of the window trading days starting lead days after a row,
+    computed separately for every symbol.
+
     :param symbols: The list of stock symbols to prepare data for
     :param window: The size of the window over which to aggregate data
+    :param lead: The number of trading days between a row and the start of its window, defaulting to twice the window
+    :param start_date: The first date to return in the form YYYY-MM-DD, or None for the whole history
+    :param end_date: The date to stop before in the form YYYY-MM-DD, or None for the whole history
+    :param features: The columns to compute rolling means of
     :return: A DataFrame of historical stock information
     """
-    data = pd.DataFrame()
+    lead = 2 * window if lead is None else lead
+
+    start = pd.Timestamp(datetime.fromisoformat(start_date)) if start_date else None
+    end = pd.Timestamp(datetime.fromisoformat(end_date)) if end_date else None
+    # Load enough trading days past the end for the last rows' forward windows
+    load_end = end + timedelta(days=2 * (lead + window) + 10) if end is not None else None
 
-    for symbol in symbols:
-        file_name = f"./data/{symbol.lower()}_us_d.csv"
-        intermediate_data = pd.read_csv(file_name)
-        intermediate_data["symbol"] = symbol
-        data = pd.concat([data, intermediate_data])
+    data = pd.concat(
+        [_load_symbol(symbol, start, load_end) for symbol in symbols],
+        ignore_index=True
+    )
 
-    data["Date"] = pd.to_datetime(data["Date"]).dt.date
+    # The sum of rows i + lead to i + lead + window - 1 is the cumulative sum through the last row
+    # minus the cumulative sum before the first, both shifted within each symbol
+    features = list(features)
+    inclusive = data.groupby("symbol")[features].cumsum()
+    exclusive = inclusive - data[features]
+    rolling = (
+        inclusive.groupby(data["symbol"]).shift(-(lead + window - 1))
+        - exclusive.groupby(data["symbol"]).shift(-lead)
+    ) / window
+    data[[f"Rolling_{feature}" for feature in features]] = rolling.to_numpy()
 
-    data["Rolling_Open"] = data[::-1]["Open"].rolling(window).mean()[::-1].shift(-(2 * window))
-    data["Rolling_High"] = data[::-1]["High"].rolling(window).mean()[::-1].shift(-(2 * window))
-    data["Rolling_Low"] = data[::-1]["Low"].rolling(window).mean()[::-1].shift(-(2 * window))
-    data["Rolling_Close"] = data[::-1]["Close"].rolling(window).mean()[::-1].shift(-(2 * window))
-    data["Rolling_Volume"] = data[::-1]["Volume"].rolling(window).mean()[::-1].shift(-(2 * window))
+    if end is not None:
+        data = data[data["Date"] < end].reset_index(drop=True)
 
     return data
@@ -1,5 +1,7 @@
 from datetime import datetime
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
 
@@ -11,26 +13,76 @@ def get_date_range(
 ) -> pd.DataFrame:
     """Modify stock DataFrame to only include certain dates.
 
+    The data is sorted by date if it is not already, and the range is found by binary search.
+
     :param data: A DataFrame of historical stock data
     :param start_date: The start date of the range in the form YYYY-MM-DD
     :param end_date: The end date of the range in the form YYYY-MM-DD
     :param date_column: The name of the date column
     :return: The modified DataFrame of stock data
     """
-    start = datetime.fromisoformat(start_date).date()
-    end = datetime.fromisoformat(end_date).date()
+    start = np.datetime64(datetime.fromisoformat(start_date), "ns")
+    end = np.datetime64(datetime.fromisoformat(end_date), "ns")
+
+    if not data[date_column].is_monotonic_increasing:
+        data = data.sort_values(date_column, kind="stable")
+
+    dates = data[date_column].to_numpy(dtype="datetime64[ns]")
+    first, last = np.searchsorted(dates, [start, end], side="left")
+
+    return data.iloc[first:last]
 
-    data_range = data[data[date_column] >= start]
-    return data_range[data_range[date_column] < end]
 
+def _next_sessions(dates: np.ndarray, sessions: np.ndarray, lag: int) -> np.ndarray:
+    """Find the trading session on or after each date, moved forward by a number of sessions.
+
+    :param dates: An array of datetime64 dates
+    :param sessions: A sorted array of unique datetime64 trading dates
+    :param lag: The number of sessions to move forward
+    :return: An array of session dates, NaT where there is no such session
+    """
+    positions = np.searchsorted(sessions, dates, side="left") + lag
+    matched = np.full(len(dates), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    valid = positions < len(sessions)
+    matched[valid] = sessions[positions[valid]]
 
-def merge_stocks_and_posts(stocks: pd.DataFrame, posts: pd.DataFrame) -> pd.DataFrame:
+    return matched
+
+
+def merge_stocks_and_posts(
+        stocks: pd.DataFrame,
+        posts: pd.DataFrame,
+        lag: int = 0,
+        by: Optional[str] = None
+) -> pd.DataFrame:
     """Merge DataFrames of stock and post data.
 
+    Each post is matched to the first trading session on or after the day it was created, so posts
+    made on weekends and holidays get the next session's prices rather than NaN.
+
     :param stocks: A DataFrame of historical stock data
     :param posts: A DataFrame of posts
+    :param lag: The number of further sessions to move each match forward
+    :param by: A column present in both DataFrames, such as symbol, to match sessions within
     :return: A merged DataFrame
     """
-    merged = posts.merge(stocks, how="left", left_on="created_date", right_on="Date")
-    merged = merged.drop(["Date"], axis=1)
+    posts = posts.copy()
+    post_dates = posts["created_date"].to_numpy(dtype="datetime64[ns]")
+
+    if by is None:
+        sessions = np.unique(stocks["Date"].to_numpy(dtype="datetime64[ns]"))
+        posts["session_date"] = _next_sessions(post_dates, sessions, lag)
+        keys = ["session_date"], ["Date"]
+    else:
+        session_dates = np.full(len(posts), np.datetime64("NaT"), dtype="datetime64[ns]")
+        for value, group in stocks.groupby(by):
+            sessions = np.unique(group["Date"].to_numpy(dtype="datetime64[ns]"))
+            rows = (posts[by] == value).to_numpy()
+            session_dates[rows] = _next_sessions(post_dates[rows], sessions, lag)
+        posts["session_date"] = session_dates
+        keys = ["session_date", by], ["Date", by]
+
+    merged = posts.merge(stocks, how="left", left_on=keys[0], right_on=keys[1])
+    merged = merged.drop(["Date", "session_date"], axis=1)
     return merged
@@ -0,0 +1,245 @@
+"""Generates a reproducible synthetic corpus shaped like r/wallstreetbets.
+
+Text lengths follow a log-normal distribution with a long tail of due diligence posts well over
+512 tokens, and texts are mixed with tickers, emoji, links, removed bodies and copypasta so that
+tokenization, tagging and the sentiment cache see roughly what they see in production.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+import random
+from typing import Dict, List, Optional
+
+TICKERS = ["GME", "AMC", "BB", "NOK", "TSLA", "PLTR", "AAPL", "SPY", "CLOV", "WISH", "NIO", "AMD"]
+
+NAMES = {
+    "GME": "GameStop Corp.",
+    "AMC": "AMC Entertainment Holdings Inc.",
+    "BB": "BlackBerry Limited",
+    "NOK": "Nokia Corporation",
+    "TSLA": "Tesla Inc.",
+    "PLTR": "Palantir Technologies Inc.",
+    "AAPL": "Apple Inc.",
+    "SPY": "SPDR S&P 500 ETF Trust",
+    "CLOV": "Clover Health Investments Corp.",
+    "WISH": "ContextLogic Inc.",
+    "NIO": "NIO Inc.",
+    "AMD": "Advanced Micro Devices Inc."
+}
+
+WORDS = (
+    "the a to and of is it this that my on for i you in just be are with have buy sell hold "
+    "calls puts shares stock market price short squeeze moon tendies apes retard bagholder yolo "
+    "gains loss porn earnings dip rally bull bear hedge fund shorts float options expiry strike "
+    "week month today tomorrow going up down going crazy literally nobody knows what happens next "
+    "position update dd analysis revenue guidance volume chart support resistance broke out"
+).split()
+
+EMOJI = ["🚀", "💎", "🙌", "🦍", "🌕", "📈", "📉", "🤡", "🐻", "🐂", "💰", "🔥"]
+
+LINKS = [
+    "https://www.reddit.com/r/wallstreetbets/comments/l6ea1b",
+    "https://i.imgur.com/4xG2bQp.png",
+    "https://finance.yahoo.com/quote/GME",
+    "http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany"
+]
+
+TITLE_TEMPLATES = [
+    "{ticker} to the moon {emoji}{emoji}{emoji}",
+    "YOLO'd my life savings into ${ticker} calls",
+    "DD: why {name} is massively undervalued",
+    "{ticker} gain porn {emoji}",
+    "{ticker} loss porn, wife's boyfriend not happy",
+    "What are your moves tomorrow?",
+    "Is it too late to buy {ticker}?",
+    "{name} earnings thread",
+    "Daily Discussion Thread",
+    "Holding {ticker} until {price} {emoji}"
+]
+
+COPYPASTA = [
+    "🚀🚀🚀",
+    "This is the way",
+    "Diamond hands 💎🙌",
+    "Apes together strong 🦍",
+    "Sir, this is a Wendy's",
+    "GME to the moon 🚀🚀🚀",
+    "[removed]",
+    "[deleted]"
+]
+
+
+@dataclass
+class SyntheticAuthor:
+    name: str
+
+
+@dataclass
+class SyntheticComment:
+    id: str
+    body: str
+    author: Optional[SyntheticAuthor]
+    created_utc: float
+
+
+@dataclass
+class SyntheticPost:
+    id: str
+    title: str
+    selftext: str
+    author: Optional[SyntheticAuthor]
+    num_comments: int
+    created_utc: float
+    comments: List[SyntheticComment] = field(default_factory=list)
+
+
+def _base36(number: int) -> str:
+    """Format a number like a Reddit id.
+
+    :param number: A non-negative integer
+    :return: The number in lower case base 36
+    """
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+
+class CorpusGenerator:
+    """Generates posts and comments from a seeded random number generator."""
+
+    def __init__(
+            self,
+            seed: int = 0,
+            duplicate_rate: float = 0.1,
+            link_rate: float = 0.05,
+            emoji_rate: float = 0.05,
+            removed_rate: float = 0.2
+    ):
+        """Initialize a CorpusGenerator.
+
+        :param seed: The seed of the random number generator
+        :param duplicate_rate: The share of comments that repeat a common copypasta
+        :param link_rate: The chance of each word being replaced by a link
+        :param emoji_rate: The chance of each word being followed by emoji
+        :param removed_rate: The share of posts with no body, or a removed one
+        """
+        self.random = random.Random(seed)
+        self.duplicate_rate = duplicate_rate
+        self.link_rate = link_rate
+        self.emoji_rate = emoji_rate
+        self.removed_rate = removed_rate
+        self.authors = [SyntheticAuthor(f"ape_{_base36(i)}") for i in range(5000)]
+        self.next_id = 36 ** 5
+
+    def _id(self) -> str:
+        """Get a new six character id."""
+        self.next_id += 1
+        return _base36(self.next_id)
+
+    def _author(self) -> Optional[SyntheticAuthor]:
+        """Get a random author, or None for a deleted account."""
+        return None if self.random.random() < 0.05 else self.random.choice(self.authors)
+
+    def _length(self, median: float, sigma: float, cap: int) -> int:
+        """Draw a word count from a log-normal distribution.
+
+        :param median: The median word count
+        :param sigma: The standard deviation of the underlying normal distribution
+        :param cap: The maximum word count
+        :return: A word count of at least one
+        """
+        return max(1, min(cap, int(self.random.lognormvariate(0, sigma) * median)))
+
+    def _text(self, words: int) -> str:
+        """Generate a text with tickers, emoji and links mixed in.
+
+        :param words: The number of words
+        :return: The text
+        """
+        tokens = []
+        for _ in range(words):
+            draw = self.random.random()
+            if draw < self.link_rate:
+                tokens.append(self.random.choice(LINKS))
+            elif draw < self.link_rate + 0.08:
+                ticker = self.random.choice(TICKERS)
+                tokens.append(f"${ticker}" if self.random.random() < 0.3 else ticker)
+            else:
+                tokens.append(self.random.choice(WORDS))
+            if self.random.random() < self.emoji_rate:
+                tokens.append(self.random.choice(EMOJI) * self.random.randint(1, 4))
+
+        return " ".join(tokens)
+
+    def _title(self) -> str:
+        """Generate a post title."""
+        ticker = self.random.choice(TICKERS)
+        return self.random.choice(TITLE_TEMPLATES).format(
+            ticker=ticker,
+            name=NAMES[ticker].split(" ")[0],
+            emoji=self.random.choice(EMOJI),
+            price=self.random.choice([69, 420, 1000, 100000])
+        )
+
+    def _post_text(self) -> str:
+        """Generate a post body, which is empty or removed for some posts."""
+        if self.random.random() < self.removed_rate:
+            return self.random.choice(["", "[removed]", "[deleted]"])
+
+        return self._text(self._length(median=40, sigma=1.3, cap=4000))
+
+    def _comment_body(self) -> str:
+        """Generate a comment body, repeating a copypasta for some comments."""
+        if self.random.random() < self.duplicate_rate:
+            return self.random.choice(COPYPASTA)
+
+        return self._text(self._length(median=12, sigma=1.0, cap=600))
+
+    def generate(self, posts: int, comments_per_post: float, start: datetime, end: datetime) -> List[SyntheticPost]:
+        """Generate posts with their comments, ordered by creation time.
+
+        :param posts: The number of posts
+        :param comments_per_post: The mean number of comments per post
+        :param start: The creation time of the earliest post
+        :param end: The creation time of the latest post
+        :return: A list of posts
+        """
+        start_utc, end_utc = start.timestamp(), end.timestamp()
+        created = sorted(self.random.uniform(start_utc, end_utc) for _ in range(posts))
+
+        corpus = []
+        for created_utc in created:
+            # A handful of posts get most of the comments, like the daily discussion threads
+            num_comments = min(int(self.random.paretovariate(1.5) * comments_per_post / 3), int(comments_per_post * 100))
+            comments = [
+                SyntheticComment(
+                    id=self._id(),
+                    body=self._comment_body(),
+                    author=self._author(),
+                    created_utc=created_utc + self.random.uniform(0, 86400)
+                )
+                for _ in range(num_comments)
+            ]
+            corpus.append(SyntheticPost(
+                id=self._id(),
+                title=self._title(),
+                selftext=self._post_text(),
+                author=self._author(),
+                num_comments=num_comments,
+                created_utc=created_utc,
+                comments=comments
+            ))
+
+        return corpus
+
+
+def index_posts(corpus: List[SyntheticPost]) -> Dict[str, SyntheticPost]:
+    """Index posts by id.
+
+    :param corpus: A list of posts
+    :return: A dictionary of posts keyed by id
+    """
+    return {post.id: post for post in corpus}
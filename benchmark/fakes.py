@@ -0,0 +1,89 @@
+"""Stand-ins for the PSAW and PRAW clients that serve a synthetic corpus with simulated request latency."""
+from bisect import bisect_left
+from time import sleep
+from typing import Generator, List, Optional
+
+from benchmark.corpus import SyntheticComment, SyntheticPost, index_posts
+
+
+class FakePushshiftAPI:
+    """Serves posts the way PushshiftAPI.search_submissions pages through them."""
+
+    def __init__(self, corpus: List[SyntheticPost], latency: float = 0.0, max_results_per_request: int = 100):
+        """Initialize a FakePushshiftAPI.
+
+        :param corpus: The posts to serve, ordered by creation time
+        :param latency: The number of seconds each page of results takes to arrive
+        :param max_results_per_request: The number of posts per page
+        """
+        self.corpus = corpus
+        self.created = [post.created_utc for post in corpus]
+        self.latency = latency
+        self.max_results_per_request = max_results_per_request
+
+    def search_submissions(
+            self,
+            after: int,
+            before: int,
+            limit: Optional[int] = None,
+            **kwargs
+    ) -> Generator[SyntheticPost, None, None]:
+        """Get the posts created in a time range, oldest first.
+
+        :param after: The Unix timestamp start of the range
+        :param before: The Unix timestamp end of the range
+        :param limit: The maximum number of posts to return
+        :return: A generator of posts
+        """
+        start = bisect_left(self.created, after)
+        end = bisect_left(self.created, before)
+        if limit is not None:
+            end = min(end, start + limit)
+
+        for i in range(start, end):
+            if (i - start) % self.max_results_per_request == 0:
+                sleep(self.latency)
+            yield self.corpus[i]
+
+
+class FakeCommentForest:
+    """Holds a post's comments like praw.models.comment_forest.CommentForest, without any MoreComments."""
+
+    def __init__(self, comments: List[SyntheticComment]):
+        self.comments = comments
+
+    def list(self) -> List[SyntheticComment]:
+        return list(self.comments)
+
+    def replace_more(self, limit: Optional[int] = 32) -> list:
+        return []
+
+
+class FakeSubmission:
+    """A post fetched from the fake Reddit client."""
+
+    def __init__(self, post: SyntheticPost):
+        self.id = post.id
+        self.comments = FakeCommentForest(post.comments)
+
+
+class FakeReddit:
+    """Serves comments the way praw.Reddit.submission loads them."""
+
+    def __init__(self, corpus: List[SyntheticPost], latency: float = 0.0):
+        """Initialize a FakeReddit.
+
+        :param corpus: The posts whose comments are served
+        :param latency: The number of seconds each submission takes to load
+        """
+        self.posts = index_posts(corpus)
+        self.latency = latency
+
+    def submission(self, post_id: str) -> FakeSubmission:
+        """Load a post with its comments.
+
+        :param post_id: The ID of the post
+        :return: The post
+        """
+        sleep(self.latency)
+        return FakeSubmission(self.posts[post_id])
@@ -0,0 +1,320 @@
+"""Benchmarks each pipeline stage on a synthetic corpus.
+
+Every stage runs against a local Postgres database, fake PSAW and PRAW clients and a tiny roBERTa
+model, and reports rows per second, p50 and p99 latency and peak RSS. Run ``python -m benchmark.run``;
+results are saved as JSON named after the current commit, and ``--compare`` prints the change
+against an earlier result.
+
+The benchmark database is emptied before each run, so never point it at the real database.
+"""
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import resource
+import subprocess
+from threading import Event, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from psycopg2.pool import ThreadedConnectionPool
+
+from benchmark.corpus import NAMES, CorpusGenerator, SyntheticPost
+from benchmark.fakes import FakePushshiftAPI, FakeReddit
+from benchmark.tiny_model import TINY_MODEL_DIR, build_tiny_model
+from db.migrate import BASE_SCHEMA, migrate
+from extractor.comment_extractor import CommentExtractor
+from extractor.post_extractor import PostExtractor
+from extractor.rate_limiter import TokenBucket
+from metrics import collector
+from sentiment.comment_adder import CommentAdder
+from sentiment.post_adder import PostAdder
+from tagging.symbol_tagger import SymbolTagger
+
+STAGES = ["extract_posts", "extract_comments", "tag", "score_posts", "score_comments"]
+
+RESULTS_DIR = "./benchmark/results"
+
+TABLES = BASE_SCHEMA + ["daily_sentiment_dirty"]
+
+START_DATE = datetime(2021, 1, 1)
+END_DATE = datetime(2021, 3, 1)
+
+
+class PeakRss:
+    """Samples the resident set size of this process in the background and keeps the peak."""
+
+    def __init__(self, interval: float = 0.05):
+        """Initialize a PeakRss.
+
+        :param interval: The number of seconds between samples
+        """
+        self.interval = interval
+        self.peak = 0
+        self._stop = Event()
+        self._thread = Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        """Get the current resident set size in bytes, or the lifetime peak where /proc is unavailable."""
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def _timed(instance: object, method: str, latencies: List[float]) -> None:
+    """Record the duration of every call to a method of one instance.
+
+    :param instance: The instance whose method is timed
+    :param method: The name of the method
+    :param latencies: The list durations are appended to, in seconds
+    :return: None
+    """
+    func = getattr(instance, method)
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            latencies.append(perf_counter() - start)
+
+    setattr(instance, method, wrapper)
+
+
+def _count(pool: ThreadedConnectionPool, query: str) -> int:
+    """Run a counting query.
+
+    :param pool: An initialized thread-safe Postgres connection pool
+    :param query: A query returning a single number
+    :return: The number
+    """
+    conn = pool.getconn()
+    cur = conn.cursor()
+    cur.execute(query)
+    count = cur.fetchone()[0]
+    conn.commit()
+    pool.putconn(conn)
+
+    return count
+
+
+def prepare_database(pool: ThreadedConnectionPool) -> None:
+    """Bring the schema up to date, empty every table and load the stocks the corpus mentions.
+
+    :param pool: An initialized thread-safe Postgres connection pool
+    :return: None
+    """
+    conn = pool.getconn()
+    migrate(conn)
+
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(TABLES)} CASCADE")
+    cur.executemany("INSERT INTO stocks (symbol, name) VALUES (%s, %s)", list(NAMES.items()))
+    conn.commit()
+    pool.putconn(conn)
+
+
+def run_stages(
+        pool: ThreadedConnectionPool,
+        corpus: List[SyntheticPost],
+        stages: List[str],
+        latency: float = 0.0,
+        backend: str = "torch",
+        batch_size: int = 32
+) -> Dict[str, dict]:
+    """Run and measure pipeline stages in order.
+
+    :param pool: An initialized thread-safe Postgres connection pool for the benchmark database
+    :param corpus: The posts served by the fake clients
+    :param stages: The stages to run, a subset of STAGES
+    :param latency: The simulated latency of each API request in seconds
+    :param backend: The roBERTa inference backend
+    :param batch_size: The number of texts passed through the model at once
+    :return: The measurements of each stage
+    """
+    # The benchmark measures our own throughput, so the rate limiters never throttle
+    limiter = TokenBucket(rate=1e9)
+
+    def extract_posts(latencies):
+        extractor = PostExtractor(FakePushshiftAPI(corpus, latency), pool, limiter)
+        _timed(extractor, "_finder_process", latencies)
+        extractor.find_all(START_DATE.date().isoformat(), END_DATE.date().isoformat())
+
+    def extract_comments(latencies):
+        extractor = CommentExtractor(FakeReddit(corpus, latency), pool, limiter)
+        _timed(extractor, "_finder_process", latencies)
+        extractor.find_all()
+
+    def tag(latencies):
+        tagger = SymbolTagger(pool)
+        _timed(tagger, "find_symbols", latencies)
+        tagger.tag_all()
+
+    def score(adder_cls):
+        def run(latencies):
+            adder = adder_cls(pool, batch_size=batch_size, backend=backend)
+            _timed(adder, "_update_rows", latencies)
+            adder.apply_sentiment()
+        return run
+
+    runs: Dict[str, Callable[[List[float]], None]] = {
+        "extract_posts": extract_posts,
+        "extract_comments": extract_comments,
+        "tag": tag,
+        "score_posts": score(PostAdder),
+        "score_comments": score(CommentAdder)
+    }
+    row_counts = {
+        "extract_posts": "SELECT COUNT(*) FROM posts",
+        "extract_comments": "SELECT COUNT(*) FROM comments",
+        "tag": "SELECT (SELECT COUNT(*) FROM posts) + (SELECT COUNT(*) FROM comments)",
+        "score_posts": "SELECT COUNT(*) FROM posts",
+        "score_comments": "SELECT COUNT(*) FROM comments"
+    }
+    latency_units = {
+        "extract_posts": "window",
+        "extract_comments": "post",
+        "tag": "text",
+        "score_posts": "chunk",
+        "score_comments": "chunk"
+    }
+
+    results = {}
+    for stage in stages:
+        logging.info(f"Running {stage}")
+        latencies = []
+        with PeakRss() as rss:
+            start = perf_counter()
+            runs[stage](latencies)
+            seconds = perf_counter() - start
+
+        rows = _count(pool, row_counts[stage])
+        results[stage] = {
+            "rows": rows,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+            "latency_unit": latency_units[stage],
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3) if latencies else None,
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3) if latencies else None,
+            "peak_rss_mb": round(rss.peak / 2 ** 20, 1)
+        }
+        logging.info(f"{stage}: {json.dumps(results[stage])}")
+
+    return results
+
+
+def _version() -> str:
+    """Get the short hash of the current commit, or unknown outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, previous: dict) -> None:
+    """Print the change in throughput and latency of each stage against an earlier result.
+
+    :param results: The current benchmark result
+    :param previous: An earlier benchmark result
+    :return: None
+    """
+    print(f"{'stage':<18}{'rows/sec':>22}{'p99 ms':>22}{'peak RSS MB':>22}")
+    for stage, current in results["stages"].items():
+        before = previous["stages"].get(stage)
+        if before is None:
+            continue
+
+        cells = []
+        for metric in ("rows_per_sec", "p99_ms", "peak_rss_mb"):
+            old, new = before.get(metric), current.get(metric)
+            change = f"{(new - old) / old:+.1%}" if old and new is not None else "n/a"
+            cells.append(f"{old} -> {new} ({change})")
+        print(f"{stage:<18}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main(argv: Optional[List[str]] = None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage on a synthetic corpus.")
+    parser.add_argument("--database", default=os.getenv("PG_BENCHMARK_DATABASE", "wsb_benchmark"),
+                        help="The local database to benchmark against; it is emptied first")
+    parser.add_argument("--posts", type=int, default=5000, help="The number of synthetic posts")
+    parser.add_argument("--comments-per-post", type=float, default=20, help="The mean number of comments per post")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic corpus")
+    parser.add_argument("--stages", default=",".join(STAGES), help="A comma separated list of stages to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="The simulated latency of each API request in seconds")
+    parser.add_argument("--backend", default="torch", help="The roBERTa inference backend")
+    parser.add_argument("--batch-size", type=int, default=32, help="The number of texts passed through the model at once")
+    parser.add_argument("--model-dir", default=TINY_MODEL_DIR, help="The tiny model directory, built if missing")
+    parser.add_argument("--output", help="The JSON file to write, defaulting to a file named after the commit")
+    parser.add_argument("--compare", help="An earlier JSON result to compare against")
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    os.environ["ROBERTA_MODEL_DIR"] = build_tiny_model(args.model_dir)
+
+    corpus = CorpusGenerator(seed=args.seed).generate(args.posts, args.comments_per_post, START_DATE, END_DATE)
+
+    pool = ThreadedConnectionPool(
+        minconn=1,
+        maxconn=10,
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        database=args.database
+    )
+    prepare_database(pool)
+
+    version = _version()
+    results = {
+        "version": version,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "stages": run_stages(pool, corpus, stages, args.latency, args.backend, args.batch_size),
+        "metrics": collector.snapshot()
+    }
+    pool.closeall()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{version}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    logging.info(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Builds a tiny randomly initialized roBERTa classifier with the real tokenizer.
+
+Its labels are meaningless, but it exercises the same tokenization, batching, padding and
+write-back paths as the full model in a fraction of the time, so benchmark runs stay short
+and comparable across machines without downloading the full weights.
+"""
+import logging
+import os
+
+from sentiment.registry import ROBERTA_LABELS, ROBERTA_MODEL_NAME
+
+TINY_MODEL_DIR = "./models/tiny-roberta"
+
+
+def build_tiny_model(path: str = TINY_MODEL_DIR, tokenizer_name: str = ROBERTA_MODEL_NAME, seed: int = 0) -> str:
+    """Save a tiny roBERTa classifier, unless one has already been saved.
+
+    :param path: The directory to save the model and tokenizer to
+    :param tokenizer_name: The name or local path of the tokenizer to copy
+    :param seed: The seed the weights are initialized from
+    :return: The directory the model was saved to
+    """
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+
+    import torch
+    from transformers import AutoTokenizer, RobertaConfig, RobertaForSequenceClassification
+
+    logging.info(f"Building a tiny roBERTa model in {path}")
+    torch.manual_seed(seed)
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    config = RobertaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=128,
+        max_position_embeddings=514,
+        type_vocab_size=1,
+        num_labels=len(ROBERTA_LABELS),
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    model = RobertaForSequenceClassification(config)
+    model.eval()
+
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+    return path
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS comment_crawl_state (
+    post_id CHARACTER VARYING(7),
+    status TEXT,
+    fetched_count INTEGER,
+    last_attempt TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY(post_id),
+    CONSTRAINT fk_posts
+        FOREIGN KEY(post_id)
+        REFERENCES posts(id)
+);
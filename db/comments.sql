@@ -11,3 +11,11 @@ CREATE TABLE IF NOT EXISTS comments (
         FOREIGN KEY(parent_id)
         REFERENCES posts(id)
 );
+
+
+CREATE INDEX IF NOT EXISTS comments_unscored_idx
+    ON comments (id)
+    WHERE (body IS NOT NULL AND (vader_score_body IS NULL OR roberta_score_body IS NULL));
+
+CREATE INDEX IF NOT EXISTS comments_parent_id_idx
+    ON comments (parent_id);
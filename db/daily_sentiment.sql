@@ -0,0 +1,51 @@
+CREATE TABLE IF NOT EXISTS daily_sentiment (
+    created_date DATE,
+    symbol CHARACTER VARYING(5),
+    model TEXT,
+    score_column TEXT,
+    num_posts INTEGER,
+    num_negative INTEGER,
+    num_neutral INTEGER,
+    num_positive INTEGER,
+    mean_score DOUBLE PRECISION,
+    PRIMARY KEY(symbol, model, score_column, created_date)
+);
+
+CREATE TABLE IF NOT EXISTS daily_sentiment_dirty (
+    id BIGSERIAL,
+    created_date DATE,
+    PRIMARY KEY(id)
+);
+
+CREATE OR REPLACE FUNCTION mark_posts_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO daily_sentiment_dirty (created_date)
+    SELECT DISTINCT created_at::date FROM changed_posts;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION mark_xref_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO daily_sentiment_dirty (created_date)
+    SELECT DISTINCT posts.created_at::date
+    FROM changed_xref
+    INNER JOIN posts
+        ON posts.id = changed_xref.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_scored_dirty ON posts;
+CREATE TRIGGER posts_scored_dirty
+    AFTER UPDATE ON posts
+    REFERENCING NEW TABLE AS changed_posts
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_posts_dirty();
+
+DROP TRIGGER IF EXISTS posts_stocks_xref_dirty ON posts_stocks_xref;
+CREATE TRIGGER posts_stocks_xref_dirty
+    AFTER INSERT ON posts_stocks_xref
+    REFERENCING NEW TABLE AS changed_xref
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_xref_dirty();
@@ -0,0 +1,150 @@
+"""Creates the schema of a database and brings it up to date with the migrations in db/migrations.
+
+Tables that do not exist yet are created from the base schema files in db/, then every migration
+that has not been applied is run in file name order, each in its own transaction, and recorded in
+schema_migrations. Running this again only applies new migrations. Run ``python -m db.migrate``.
+"""
+import argparse
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from psycopg2.extensions import connection
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(SCHEMA_DIR, "migrations")
+
+# Base schema files in dependency order, named after the table they create
+BASE_SCHEMA = [
+    "stocks",
+    "posts",
+    "comments",
+    "posts_stocks_xref",
+    "comments_stocks_xref",
+    "sentiment_checkpoints",
+    "sentiment_cache",
+    "post_extraction_windows",
+    "comment_crawl_state",
+    "daily_sentiment"
+]
+
+
+def _create_missing_tables(conn: connection) -> List[str]:
+    """Create the tables of the base schema that do not exist yet.
+
+    :param conn: An open Postgres connection
+    :return: The names of the tables created
+    """
+    cur = conn.cursor()
+    created = []
+    for name in BASE_SCHEMA:
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            with open(os.path.join(SCHEMA_DIR, f"{name}.sql")) as schema:
+                cur.execute(schema.read())
+            created.append(name)
+    conn.commit()
+
+    return created
+
+
+def pending_migrations(conn: connection) -> List[Tuple[str, str]]:
+    """Find the migrations that have not been applied.
+
+    :param conn: An open Postgres connection
+    :return: A list of (version, path) pairs in the order they should be applied
+    """
+    cur = conn.cursor()
+    cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version TEXT,
+                    applied_at TIMESTAMP WITHOUT TIME ZONE,
+                    PRIMARY KEY(version)
+                )
+                """)
+    cur.execute("SELECT version FROM schema_migrations")
+    applied = {result[0] for result in cur.fetchall()}
+    conn.commit()
+
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        version, extension = os.path.splitext(file_name)
+        if extension == ".sql" and version not in applied:
+            migrations.append((version, os.path.join(MIGRATIONS_DIR, file_name)))
+
+    return migrations
+
+
+def check_current(conn: connection) -> None:
+    """Refuse to run against a database with migrations that have not been applied.
+
+    The pipeline writes to the migrated schema, such as the sentiment_label enum and the month partitions.
+
+    :param conn: An open Postgres connection
+    :return: None
+    """
+    pending = [version for version, _ in pending_migrations(conn)]
+    if pending:
+        raise RuntimeError(
+            f"The database schema is out of date, run python -m db.migrate to apply {', '.join(pending)}"
+        )
+
+
+def migrate(conn: connection, dry_run: bool = False) -> List[str]:
+    """Create missing tables and apply pending migrations.
+
+    A migration that fails is rolled back and stops the run, leaving earlier migrations applied.
+
+    :param conn: An open Postgres connection
+    :param dry_run: Whether to only list the pending migrations
+    :return: The versions of the migrations applied, or pending for a dry run
+    """
+    if dry_run:
+        return [version for version, _ in pending_migrations(conn)]
+
+    created = _create_missing_tables(conn)
+    if created:
+        logging.info(f"Created tables {', '.join(created)}")
+
+    applied = []
+    for version, path in pending_migrations(conn):
+        logging.info(f"Applying migration {version}")
+        with open(path) as migration:
+            sql = migration.read()
+
+        cur = conn.cursor()
+        try:
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, applied_at) VALUES (%s, NOW())", (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+
+def main(argv: Optional[List[str]] = None):
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Create the schema and apply pending migrations.")
+    parser.add_argument("--database", default=os.getenv("PG_DATABASE"), help="The database to migrate")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the pending migrations")
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(user=os.getenv("PG_USER"), password=os.getenv("PG_PASSWORD"), database=args.database)
+    try:
+        versions = migrate(conn, args.dry_run)
+    finally:
+        conn.close()
+
+    logging.info(f"{'Pending' if args.dry_run else 'Applied'} migrations: {', '.join(versions) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
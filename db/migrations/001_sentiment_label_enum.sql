@@ -0,0 +1,16 @@
+-- Store sentiment labels as a four byte enum instead of TEXT
+CREATE TYPE sentiment_label AS ENUM ('negative', 'neutral', 'positive');
+
+ALTER TABLE posts
+    ALTER COLUMN vader_score_title TYPE sentiment_label USING vader_score_title::sentiment_label,
+    ALTER COLUMN roberta_score_title TYPE sentiment_label USING roberta_score_title::sentiment_label,
+    ALTER COLUMN vader_score_post_text TYPE sentiment_label USING vader_score_post_text::sentiment_label,
+    ALTER COLUMN roberta_score_post_text TYPE sentiment_label USING roberta_score_post_text::sentiment_label;
+
+ALTER TABLE comments
+    ALTER COLUMN vader_score_body TYPE sentiment_label USING vader_score_body::sentiment_label,
+    ALTER COLUMN roberta_score_body TYPE sentiment_label USING roberta_score_body::sentiment_label;
+
+ALTER TABLE sentiment_cache
+    ALTER COLUMN vader_score TYPE sentiment_label USING vader_score::sentiment_label,
+    ALTER COLUMN roberta_score TYPE sentiment_label USING roberta_score::sentiment_label;
@@ -0,0 +1,20 @@
+-- Key the xref tables on (symbol, id) so symbol lookups use an index and tags cannot be duplicated
+DELETE FROM posts_stocks_xref WHERE id IS NULL OR symbol IS NULL;
+DELETE FROM posts_stocks_xref AS duplicate
+USING posts_stocks_xref AS original
+WHERE duplicate.id = original.id
+AND duplicate.symbol = original.symbol
+AND duplicate.ctid > original.ctid;
+
+ALTER TABLE posts_stocks_xref ADD PRIMARY KEY (symbol, id);
+CREATE INDEX posts_stocks_xref_id_idx ON posts_stocks_xref (id);
+
+DELETE FROM comments_stocks_xref WHERE id IS NULL OR symbol IS NULL;
+DELETE FROM comments_stocks_xref AS duplicate
+USING comments_stocks_xref AS original
+WHERE duplicate.id = original.id
+AND duplicate.symbol = original.symbol
+AND duplicate.ctid > original.ctid;
+
+ALTER TABLE comments_stocks_xref ADD PRIMARY KEY (symbol, id);
+CREATE INDEX comments_stocks_xref_id_idx ON comments_stocks_xref (id);
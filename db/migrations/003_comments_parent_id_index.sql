@@ -0,0 +1,2 @@
+-- Databases created before comments.sql gained this index are missing it
+CREATE INDEX IF NOT EXISTS comments_parent_id_idx ON comments (parent_id);
@@ -0,0 +1,113 @@
+-- Partition posts and comments by created_at month
+--
+-- A partitioned table's keys must include created_at, so ids are only unique together with it and
+-- foreign keys can no longer reference posts(id) or comments(id); those constraints are dropped.
+-- Rows outside the created partitions land in a default partition; call create_month_partitions
+-- before extracting a new date range to keep them out of it.
+CREATE OR REPLACE FUNCTION create_month_partitions(parent TEXT, start_date DATE, end_date DATE) RETURNS VOID AS $$
+DECLARE
+    month DATE := date_trunc('month', start_date);
+BEGIN
+    WHILE month < end_date LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            parent || '_' || to_char(month, 'YYYY_MM'),
+            parent,
+            month,
+            (month + INTERVAL '1 month')::date
+        );
+        month := month + INTERVAL '1 month';
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE posts RENAME TO posts_unpartitioned;
+ALTER TABLE posts_unpartitioned RENAME CONSTRAINT posts_pkey TO posts_unpartitioned_pkey;
+ALTER INDEX IF EXISTS posts_unscored_idx RENAME TO posts_unpartitioned_unscored_idx;
+ALTER INDEX IF EXISTS posts_num_comments_idx RENAME TO posts_unpartitioned_num_comments_idx;
+
+ALTER TABLE comments RENAME TO comments_unpartitioned;
+ALTER TABLE comments_unpartitioned RENAME CONSTRAINT comments_pkey TO comments_unpartitioned_pkey;
+ALTER INDEX IF EXISTS comments_unscored_idx RENAME TO comments_unpartitioned_unscored_idx;
+ALTER INDEX IF EXISTS comments_parent_id_idx RENAME TO comments_unpartitioned_parent_id_idx;
+
+CREATE TABLE posts (
+    id CHARACTER VARYING(7),
+    title TEXT,
+    post_text TEXT,
+    author TEXT,
+    num_comments INTEGER,
+    created_at TIMESTAMP WITHOUT TIME ZONE,
+    vader_score_title sentiment_label,
+    roberta_score_title sentiment_label,
+    vader_score_post_text sentiment_label,
+    roberta_score_post_text sentiment_label,
+    PRIMARY KEY(id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE comments (
+    id CHARACTER VARYING(7),
+    parent_id CHARACTER VARYING(7),
+    author TEXT,
+    body TEXT,
+    created_at TIMESTAMP WITHOUT TIME ZONE,
+    vader_score_body sentiment_label,
+    roberta_score_body sentiment_label,
+    PRIMARY KEY(id, created_at)
+) PARTITION BY RANGE (created_at);
+
+SELECT create_month_partitions(
+    'posts',
+    LEAST(COALESCE(MIN(created_at)::date, '2020-12-01'), '2020-12-01'),
+    GREATEST(COALESCE(MAX(created_at)::date, '2022-01-01'), '2022-01-01') + 1
+)
+FROM posts_unpartitioned;
+CREATE TABLE posts_default PARTITION OF posts DEFAULT;
+
+SELECT create_month_partitions(
+    'comments',
+    LEAST(COALESCE(MIN(created_at)::date, '2020-12-01'), '2020-12-01'),
+    GREATEST(COALESCE(MAX(created_at)::date, '2022-01-01'), '2022-01-01') + 1
+)
+FROM comments_unpartitioned;
+CREATE TABLE comments_default PARTITION OF comments DEFAULT;
+
+INSERT INTO posts
+    (id, title, post_text, author, num_comments, created_at,
+     vader_score_title, roberta_score_title, vader_score_post_text, roberta_score_post_text)
+SELECT
+    id, title, post_text, author, num_comments, created_at,
+    vader_score_title, roberta_score_title, vader_score_post_text, roberta_score_post_text
+FROM posts_unpartitioned;
+
+INSERT INTO comments
+    (id, parent_id, author, body, created_at, vader_score_body, roberta_score_body)
+SELECT
+    id, parent_id, author, body, created_at, vader_score_body, roberta_score_body
+FROM comments_unpartitioned;
+
+CREATE INDEX posts_unscored_idx
+    ON posts (id)
+    WHERE (title IS NOT NULL AND (vader_score_title IS NULL OR roberta_score_title IS NULL))
+    OR (post_text IS NOT NULL AND (vader_score_post_text IS NULL OR roberta_score_post_text IS NULL));
+
+CREATE INDEX posts_num_comments_idx
+    ON posts (num_comments DESC, id DESC)
+    WHERE num_comments > 0;
+
+CREATE INDEX comments_unscored_idx
+    ON comments (id)
+    WHERE (body IS NOT NULL AND (vader_score_body IS NULL OR roberta_score_body IS NULL));
+
+CREATE INDEX comments_parent_id_idx
+    ON comments (parent_id);
+
+-- Also drops the foreign keys of comment_crawl_state and the xref tables, and the posts_scored_dirty trigger
+DROP TABLE comments_unpartitioned CASCADE;
+DROP TABLE posts_unpartitioned CASCADE;
+
+CREATE TRIGGER posts_scored_dirty
+    AFTER UPDATE ON posts
+    REFERENCING NEW TABLE AS changed_posts
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_posts_dirty();
@@ -0,0 +1,11 @@
+-- Track which rows have been tagged instead of keeping a high-water mark of tagged ids
+--
+-- Rows do not arrive in id order, so a row inserted after the checkpoint passed its id was never
+-- tagged. Every row starts untagged and is tagged again once; tags that already exist are kept.
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS tagged BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS tagged BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS posts_untagged_idx ON posts (id) WHERE NOT tagged;
+CREATE INDEX IF NOT EXISTS comments_untagged_idx ON comments (id) WHERE NOT tagged;
+
+DROP TABLE IF EXISTS tagging_checkpoints;
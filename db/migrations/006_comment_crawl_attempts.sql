@@ -0,0 +1,16 @@
+-- Count the attempts at each post's comments, so failed posts are retried with a backoff and then given up on
+ALTER TABLE comment_crawl_state ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 1;
+
+-- Posts whose comments were extracted before comment_crawl_state existed would otherwise be fetched again
+INSERT INTO comment_crawl_state
+    (post_id, status, fetched_count, attempts, last_attempt)
+SELECT
+    parent_id,
+    'done',
+    COUNT(*),
+    1,
+    NOW()
+FROM comments
+WHERE parent_id IS NOT NULL
+GROUP BY parent_id
+ON CONFLICT (post_id) DO NOTHING;
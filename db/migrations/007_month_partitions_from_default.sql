@@ -0,0 +1,37 @@
+-- Let create_month_partitions add a month whose rows already landed in the default partition
+--
+-- Creating a partition fails while the default partition holds rows that belong in it, so a missing
+-- month is created detached, the rows are moved into it and it is then attached.
+CREATE OR REPLACE FUNCTION create_month_partitions(parent TEXT, start_date DATE, end_date DATE) RETURNS VOID AS $$
+DECLARE
+    month DATE := date_trunc('month', start_date);
+    next_month DATE;
+    partition_name TEXT;
+BEGIN
+    WHILE month < end_date LOOP
+        next_month := (month + INTERVAL '1 month')::date;
+        partition_name := parent || '_' || to_char(month, 'YYYY_MM');
+
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                parent || '_default',
+                month,
+                next_month,
+                partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent,
+                partition_name,
+                month,
+                next_month
+            );
+        END IF;
+
+        month := next_month;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,29 @@
+-- Record when each post and comment last changed, so snapshot exports rewrite the days that changed
+--
+-- Scoring and tagging both update the row, so new scores and tags bump updated_at as well as inserts.
+-- Existing rows get the time of the migration, which makes the next incremental export a full one.
+-- Row-level BEFORE triggers on partitioned tables need Postgres 13 or later.
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW();
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS posts_updated_at_idx ON posts (updated_at);
+CREATE INDEX IF NOT EXISTS comments_updated_at_idx ON comments (updated_at);
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_touch_updated_at ON posts;
+CREATE TRIGGER posts_touch_updated_at
+    BEFORE UPDATE ON posts
+    FOR EACH ROW
+    EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS comments_touch_updated_at ON comments;
+CREATE TRIGGER comments_touch_updated_at
+    BEFORE UPDATE ON comments
+    FOR EACH ROW
+    EXECUTE FUNCTION touch_updated_at();
@@ -0,0 +1,24 @@
+"""Creates the month partitions of posts and comments before rows for those months are inserted.
+
+Rows without a partition land in the default partition; create_month_partitions, defined by the
+migrations, moves them out again when their month is created.
+"""
+from datetime import date
+
+from psycopg2.pool import ThreadedConnectionPool
+
+
+def create_month_partitions(pool: ThreadedConnectionPool, table: str, start_date: date, end_date: date) -> None:
+    """Create the missing month partitions of a table for a date range.
+
+    :param pool: An initialized thread-safe Postgres connection pool
+    :param table: Either posts or comments
+    :param start_date: The first day that needs a partition
+    :param end_date: The day after the last day that needs a partition
+    :return: None
+    """
+    conn = pool.getconn()
+    cur = conn.cursor()
+    cur.execute("SELECT create_month_partitions(%s, %s, %s)", (table, start_date, end_date))
+    conn.commit()
+    pool.putconn(conn)
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS post_extraction_windows (
+    subreddit TEXT,
+    start_utc BIGINT,
+    end_utc BIGINT,
+    post_count INTEGER,
+    completed_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY(subreddit, start_utc, end_utc)
+);
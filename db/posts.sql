@@ -10,4 +10,13 @@ CREATE TABLE IF NOT EXISTS posts (
     vader_score_post_text TEXT,
     roberta_score_post_text TEXT,
     PRIMARY KEY(id)
-);    
\ No newline at end of file
+);    
+
+CREATE INDEX IF NOT EXISTS posts_unscored_idx
+    ON posts (id)
+    WHERE (title IS NOT NULL AND (vader_score_title IS NULL OR roberta_score_title IS NULL))
+    OR (post_text IS NOT NULL AND (vader_score_post_text IS NULL OR roberta_score_post_text IS NULL));
+
+CREATE INDEX IF NOT EXISTS posts_num_comments_idx
+    ON posts (num_comments DESC, id DESC)
+    WHERE num_comments > 0;
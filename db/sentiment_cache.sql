@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS sentiment_cache (
+    text_hash CHARACTER(64),
+    model_name TEXT,
+    vader_score TEXT,
+    roberta_score TEXT,
+    PRIMARY KEY(text_hash, model_name)
+);
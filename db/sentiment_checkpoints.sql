@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS sentiment_checkpoints (
+    table_name TEXT,
+    last_id CHARACTER VARYING(7),
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY(table_name)
+);
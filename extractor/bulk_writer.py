@@ -0,0 +1,124 @@
+import logging
+from queue import Queue
+from time import perf_counter
+from typing import List, Optional
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import collector
+
+
+class BulkWriter:
+    """Buffers extracted rows and inserts them into Postgres one batch per transaction.
+
+    Rows whose key already exists are skipped, so rerunning an extraction is idempotent.
+    A BulkWriter is not thread-safe; each worker should use its own.
+    """
+
+    def __init__(
+            self,
+            pool: ThreadedConnectionPool,
+            table: str,
+            columns: List[str],
+            batch_size: int = 1000,
+            key_columns: Optional[List[str]] = None
+    ):
+        """Initialize a BulkWriter.
+
+        :param pool: An initialized thread-safe Postgres connection pool
+        :param table: The name of the table to insert into
+        :param columns: The names of the columns of each row
+        :param batch_size: The number of buffered rows that triggers an insert
+        :param key_columns: The columns of the table's primary key, defaulting to id
+        """
+        self.pool = pool
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.key_columns = key_columns or ["id"]
+
+        self.rows_written = 0
+        self.write_time = 0.0
+        self.error: Optional[Exception] = None
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def add(self, row: tuple) -> None:
+        """Buffer a row, inserting the buffer once it is full.
+
+        :param row: A tuple of values in the order of the writer's columns
+        :return: None
+        """
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Insert every buffered row in a single transaction.
+
+        :return: None
+        """
+        if not self._buffer:
+            return
+
+        rows, self._buffer = self._buffer, []
+        query = f"""
+                INSERT INTO {self.table}
+                    ({", ".join(self.columns)})
+                VALUES %s
+                ON CONFLICT ({", ".join(self.key_columns)}) DO NOTHING
+                """
+
+        start = perf_counter()
+        conn = self.pool.getconn()
+        try:
+            cur = conn.cursor()
+            execute_values(cur, query, rows, page_size=len(rows))
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
+        elapsed = perf_counter() - start
+        self.write_time += elapsed
+        self.rows_written += len(rows)
+        collector.observe("db_flush_seconds", elapsed, table=self.table, statement="insert")
+        collector.inc("rows_written", len(rows), table=self.table, statement="insert")
+
+        logging.info(
+            f"Inserted {len(rows)} rows into {self.table} "
+            f"({self.rows_written / self.write_time:.0f} rows/sec)"
+        )
+
+    def consume(self, rows: Queue) -> None:
+        """Insert rows taken from a queue until a None sentinel is received.
+
+        Callables in the queue are run once every row queued before them has been committed,
+        which lets fetchers checkpoint their progress. If an insert fails, the error is kept in
+        self.error for the caller to raise and the rest of the queue is drained without writing or
+        checkpointing, so fetchers blocked on a full queue are not left waiting forever.
+
+        :param rows: A queue of row tuples filled by fetching threads
+        :return: None
+        """
+        try:
+            with self:
+                while (row := rows.get()) is not None:
+                    if callable(row):
+                        self.flush()
+                        row()
+                    else:
+                        self.add(row)
+                        if not self._buffer:
+                            collector.set_gauge("queue_depth", rows.qsize(), queue=self.table)
+        except Exception as e:
+            logging.exception(f"Could not write rows to {self.table}, discarding the rest of the queue")
+            self.error = e
+            self._buffer = []
+            while rows.get() is not None:
+                pass
@@ -1,46 +1,143 @@
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
 import logging
-from typing import Generator, List
+from queue import Queue
+from threading import Thread
+from typing import Callable, Generator, Optional
 
 from praw import Reddit
-from praw.models import Comment
+from praw.models import Comment, MoreComments
 from psycopg2.pool import ThreadedConnectionPool
 
+from db.partitions import create_month_partitions
+from extractor.bulk_writer import BulkWriter
+from extractor.rate_limiter import TokenBucket, with_retries
+from metrics import collector
+
 
 class CommentExtractor:
     """Extracts comments using PSAW and PRAW."""
-    def __init__(self, client: Reddit, pool: ThreadedConnectionPool):
+    def __init__(
+            self,
+            client: Reddit,
+            pool: ThreadedConnectionPool,
+            limiter: Optional[TokenBucket] = None,
+            max_workers: int = 4,
+            queue_size: int = 10000,
+            max_attempts: int = 5,
+            retry_backoff: timedelta = timedelta(hours=1),
+            throttle: Optional[Callable[[], None]] = None
+    ):
         """Initialize a CommentExtractor instance.
 
         :param client: An initialized PRAW client
         :param pool: An initialized thread-safe Postgres connection pool
+        :param limiter: A rate limiter shared by every request, defaulting to Reddit's 100 requests per minute
+        :param max_workers: The number of posts fetched concurrently
+        :param queue_size: The number of fetched comments that may wait to be written
+        :param max_attempts: The number of failed attempts after which a post is no longer fetched
+        :param retry_backoff: The time before a failed post is fetched again, doubled after each failed attempt
+        :param throttle: A function called before each fetch that blocks while downstream stages catch up
         """
         self.client = client
         self.pool = pool
-
-    def _get_post_ids(self) -> List[str]:
-        """Retrieve all post IDs stored in the database."""
-        conn = self.pool.getconn()
-        cur = conn.cursor()
-
+        self.limiter = limiter or TokenBucket(rate=100 / 60)
+        self.max_workers = max_workers
+        self.rows = Queue(maxsize=queue_size)
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.throttle = throttle
+        self.writer: Optional[BulkWriter] = None
+
+    def _get_post_ids(self, page_size: int = 10000) -> Generator[str, None, None]:
+        """Retrieve the IDs of posts whose comments have not been fully extracted.
+
+        Posts are paged through with a keyset on (num_comments, id), busiest first. Posts that failed
+        are skipped until their backoff has passed, and for good after max_attempts attempts.
+
+        :param page_size: The number of IDs retrieved per query
+        :return: A generator of post IDs
+        """
         query = """
-                SELECT 
-                    DISTINCT posts.id
+                SELECT
+                    posts.id,
+                    posts.num_comments
                 FROM posts
-                WHERE posts.id NOT IN (
-                    SELECT DISTINCT parent_id
-                    FROM comments
+                WHERE posts.num_comments > 0
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM comment_crawl_state AS state
+                    WHERE state.post_id = posts.id
+                    AND (
+                        state.status = 'done'
+                        OR state.attempts >= %s
+                        OR state.last_attempt > NOW() - %s * POWER(2, state.attempts - 1)
+                    )
                 )
-                AND posts.num_comments > 0
-                ORDER BY posts.id ASC
+                AND (%s IS NULL OR (posts.num_comments, posts.id) < (%s, %s))
+                ORDER BY posts.num_comments DESC, posts.id DESC
+                LIMIT %s
+                """
+        last_num_comments, last_id = None, None
+
+        while True:
+            conn = self.pool.getconn()
+            cur = conn.cursor()
+            cur.execute(
+                query,
+                (self.max_attempts, self.retry_backoff, last_id, last_num_comments, last_id, page_size)
+            )
+            results = cur.fetchall()
+            conn.commit()
+            self.pool.putconn(conn)
+
+            for post_id, _ in results:
+                yield post_id
+
+            if len(results) < page_size:
+                return
+            last_id, last_num_comments = results[-1]
+
+    def _record_state(self, post_id: str, status: str, fetched_count: int) -> None:
+        """Record an attempt at a post's comments.
+
+        :param post_id: The ID of the post
+        :param status: Either done or failed
+        :param fetched_count: The number of comments fetched
+        :return: None
+        """
+        query = """
+                INSERT INTO comment_crawl_state
+                    (post_id, status, fetched_count, attempts, last_attempt)
+                VALUES
+                    (%s, %s, %s, 1, NOW())
+                ON CONFLICT (post_id) DO UPDATE
+                SET
+                    status = EXCLUDED.status,
+                    fetched_count = EXCLUDED.fetched_count,
+                    attempts = comment_crawl_state.attempts + 1,
+                    last_attempt = EXCLUDED.last_attempt
                 """
-        cur.execute(query)
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(query, (post_id, status, fetched_count))
+        conn.commit()
+        self.pool.putconn(conn)
 
-        results = [result[0] for result in cur.fetchall()]
+    def _get_oldest_post_date(self) -> Optional[date]:
+        """Get the day the oldest stored post was created.
 
+        :return: The date, or None if there are no posts
+        """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(created_at)::date FROM posts")
+        result = cur.fetchone()[0]
+        conn.commit()
         self.pool.putconn(conn)
-        return results
+
+        return result
 
     def _get_generator(
             self,
@@ -52,39 +149,55 @@ class CommentExtractor:
         :return: A generator of comments
         """
         submission = self.client.submission(post_id)
+
+        self.limiter.acquire()
+        # Expanding a MoreComments costs one request; nested ones revealed while expanding are paced by PRAW
+        more_comments = [item for item in submission.comments.list() if isinstance(item, MoreComments)]
+        for _ in more_comments:
+            self.limiter.acquire()
         submission.comments.replace_more(limit=None)
+
         for comment in submission.comments.list():
             yield comment
 
     def _finder_process(self, post_id: str, subreddit: str) -> None:
-        """Extract the comments for the specified post.
+        """Fetch the comments for the specified post and queue them for writing.
+
+        The post is only marked done once all of its comments have been committed.
 
         :param post_id: The ID of the post
         :return: None
         """
-        logging.info(f"Processing post {post_id}...")
-
-        generator = self._get_generator(post_id)
-
-        conn = self.pool.getconn()
-        for comment in generator:
+        if self.writer.error:
+            # Nothing more can be written, so the post is left for the next run
+            return
+        if self.throttle:
+            self.throttle()
+        if collector.sample("extract_comments"):
+            logging.debug(f"Processing post {post_id}...")
+
+        def fetch():
+            with collector.timer("fetch_seconds", source="reddit"):
+                return list(self._get_generator(post_id))
+
+        try:
+            comments = with_retries(fetch)
+        except Exception:
+            logging.exception(f"Could not process post {post_id}")
+            collector.inc("rows_failed", stage="extract_comments")
+            self._record_state(post_id, "failed", 0)
+            return
+
+        for comment in comments:
             comment_id = comment.id
             body = comment.body
             author = comment.author.name if comment.author else None
             created_at = datetime.utcfromtimestamp(comment.created_utc)
 
-            query = """
-                    INSERT INTO comments
-                        (id, parent_id, body, author, created_at)
-                    VALUES
-                        (%s, %s, %s, %s, %s)
-                    """
-            cur = conn.cursor()
-            cur.execute(query, (comment_id, post_id, body, author, created_at))
-
-            conn.commit()
+            self.rows.put((comment_id, post_id, body, author, created_at))
 
-        self.pool.putconn(conn)
+        self.rows.put(partial(self._record_state, post_id, "done", len(comments)))
+        collector.inc("rows_done", len(comments), stage="extract_comments")
 
     def find_all(
             self,
@@ -92,15 +205,37 @@ class CommentExtractor:
     ) -> None:
         """Find all comments and insert them in a Postgres database.
 
+        Comments can be written any time from their post's creation until today, so the month
+        partitions of that range are created before any comment is written.
+
         :param subreddit: The name of the subreddit to search
         :return: None
         """
+        today = datetime.utcnow().date()
+        create_month_partitions(
+            self.pool,
+            "comments",
+            self._get_oldest_post_date() or today,
+            today + timedelta(days=1)
+        )
+
         posts = self._get_post_ids()
 
-        with ThreadPoolExecutor() as executor:
+        columns = ["id", "parent_id", "body", "author", "created_at"]
+        # Comments are partitioned by month, so ids are only unique together with created_at
+        self.writer = BulkWriter(self.pool, "comments", columns, key_columns=["id", "created_at"])
+        writer = Thread(target=self.writer.consume, args=(self.rows,))
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             for post in posts:
                 executor.submit(
                     self._finder_process,
                     post,
                     subreddit
                 )
+
+        self.rows.put(None)
+        writer.join()
+        if self.writer.error:
+            raise self.writer.error
@@ -1,26 +1,61 @@
-from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from itertools import pairwise
+from functools import partial
 import logging
-from time import sleep
-from typing import Generator, Optional, List
+from queue import PriorityQueue, Queue
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Generator, Iterable, Optional, List, Tuple
 
 from psaw import PushshiftAPI
 from praw.models import Submission
 from psycopg2.pool import ThreadedConnectionPool
 
+from db.partitions import create_month_partitions
+from extractor.bulk_writer import BulkWriter
+from metrics import collector
+from extractor.rate_limiter import TokenBucket, with_retries
+
 
 class PostExtractor:
     """Extracts posts using PSAW and PRAW."""
 
-    def __init__(self, api: PushshiftAPI, pool: ThreadedConnectionPool):
+    def __init__(
+            self,
+            api: PushshiftAPI,
+            pool: ThreadedConnectionPool,
+            limiter: Optional[TokenBucket] = None,
+            max_workers: int = 4,
+            queue_size: int = 10000,
+            page_size: Optional[int] = None,
+            initial_window: timedelta = timedelta(days=7),
+            min_window: timedelta = timedelta(minutes=10),
+            max_window_posts: int = 5000,
+            throttle: Optional[Callable[[], None]] = None
+    ):
         """Initialize a PostExtractor instance.
 
         :param api: An initialized PushshiftAPI client
         :param pool: An initialized thread-safe Postgres connection pool
+        :param limiter: A rate limiter shared by every request, defaulting to one request per second
+        :param max_workers: The number of windows fetched concurrently
+        :param queue_size: The number of fetched posts that may wait to be written
+        :param page_size: The number of posts the API returns per request, defaulting to the API's max_results_per_request
+        :param initial_window: The length of the windows a date range is first divided into
+        :param min_window: The shortest window a dense window is split into
+        :param max_window_posts: The number of posts after which the rest of a window is split
+        :param throttle: A function called before each fetch that blocks while downstream stages catch up
         """
         self.api = api
         self.pool = pool
+        self.limiter = limiter or TokenBucket(rate=1.0)
+        self.max_workers = max_workers
+        self.page_size = page_size or getattr(api, "max_results_per_request", 100)
+        self.rows = Queue(maxsize=queue_size)
+        self.initial_window = int(initial_window.total_seconds())
+        self.min_window = int(min_window.total_seconds())
+        self.max_window_posts = max_window_posts
+        self.throttle = throttle
+        self.writer: Optional[BulkWriter] = None
 
     @staticmethod
     def _str_to_unix_timestamp(date: datetime.date) -> int:
@@ -31,26 +66,6 @@ class PostExtractor:
         """
         return int(date.timestamp())
 
-    def _get_all_dates_in_range(
-            self,
-            start_date: datetime.date,
-            end_date: datetime.date
-    ) -> List[int]:
-        """Return all dates between two dates.
-
-        :param start_date: The start date of the range
-        :param end_date: The end date of the range
-        :return: A list of dates as Unix timestamps
-        """
-        delta = end_date - start_date
-        days = []
-
-        for i in range(delta.days + 1):
-            date = self._str_to_unix_timestamp(start_date + timedelta(days=i))
-            days.append(date)
-
-        return days
-
     def _get_generator(
             self,
             start_date: int,
@@ -66,7 +81,6 @@ class PostExtractor:
         :param limit: The maximum number of posts the API returns
         :return: A generator of posts
         """
-        sleep(1)
         return self.api.search_submissions(
             after=start_date,
             before=end_date,
@@ -84,50 +98,225 @@ class PostExtractor:
             limit=limit
         )
 
+    def _paced(self, generator: Iterable[Submission]) -> Generator[Submission, None, None]:
+        """Take a rate limiter token before each page of results is requested.
+
+        :param generator: A lazily paginated generator of posts
+        :return: The same posts
+        """
+        posts = iter(generator)
+        count = 0
+        while True:
+            new_page = count % self.page_size == 0
+            if new_page:
+                self.limiter.acquire()
+            start = perf_counter()
+            try:
+                post = next(posts)
+            except StopIteration:
+                return
+            finally:
+                if new_page:
+                    collector.observe("fetch_seconds", perf_counter() - start, source="pushshift")
+            count += 1
+            yield post
+
+    def _load_completed_windows(self, subreddit: str) -> List[Tuple[int, int, int]]:
+        """Retrieve the time windows already extracted for a subreddit.
+
+        :param subreddit: The name of the subreddit
+        :return: A sorted list of (start, end, post count) tuples, the start and end as Unix timestamps
+        """
+        query = """
+                SELECT start_utc, end_utc, post_count
+                FROM post_extraction_windows
+                WHERE subreddit = %s
+                ORDER BY start_utc ASC
+                """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(query, (subreddit,))
+        results = cur.fetchall()
+        conn.commit()
+        self.pool.putconn(conn)
+
+        return results
+
+    def _record_window(self, subreddit: str, start: int, end: int, post_count: int) -> None:
+        """Record a time window whose posts have all been written.
+
+        :param subreddit: The name of the subreddit
+        :param start: The start of the window as a Unix timestamp
+        :param end: The end of the window as a Unix timestamp
+        :param post_count: The number of posts found in the window
+        :return: None
+        """
+        query = """
+                INSERT INTO post_extraction_windows
+                    (subreddit, start_utc, end_utc, post_count, completed_at)
+                VALUES
+                    (%s, %s, %s, %s, NOW())
+                ON CONFLICT (subreddit, start_utc, end_utc) DO NOTHING
+                """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(query, (subreddit, start, end, post_count))
+        conn.commit()
+        self.pool.putconn(conn)
+
+    def _get_pending_windows(self, start: int, end: int, subreddit: str) -> List[Tuple[int, int, float]]:
+        """Split the parts of a time range that have not been extracted into initial windows.
+
+        Each gap is sized by the density of the extracted windows bordering it, so that a window is
+        expected to hold about max_window_posts posts: quiet stretches are merged into long windows and
+        busy ones start out short. Gaps with no extracted neighbours, such as a fresh backfill, are split
+        into initial_window windows. Either way, dense windows are split further while they are fetched.
+
+        Windows are returned with Pushshift's exclusive bounds, each starting a second before the first
+        second it covers, so windows and the gaps between recorded windows are covered without holes.
+
+        :param start: The start of the range as a Unix timestamp
+        :param end: The end of the range as a Unix timestamp
+        :param subreddit: The name of the subreddit
+        :return: A list of (after, before, estimated post count) tuples, the bounds as exclusive Unix timestamps
+        """
+        def density(window: Optional[Tuple[int, int, int]], edge: int) -> Optional[float]:
+            # Only windows touching a gap say anything about its volume
+            if window is None or min(abs(window[0] - edge), abs(window[1] - edge)) > self.min_window:
+                return None
+            return window[2] / max(1, window[1] - window[0])
+
+        # Gaps are the seconds from cursor up to but excluding the gap's end that no recorded window covers
+        gaps = []
+        cursor = start
+        previous = None
+        for window in self._load_completed_windows(subreddit):
+            done_start, done_end, _ = window
+            if done_start >= cursor:
+                neighbours = [d for d in (density(previous, cursor), density(window, done_start)) if d is not None]
+                gap_density = sum(neighbours) / len(neighbours) if neighbours else None
+                gaps.append((cursor, min(done_start + 1, end), gap_density))
+            if done_end >= cursor:
+                cursor = done_end
+                previous = window
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end, density(previous, cursor)))
+
+        windows = []
+        for gap_start, gap_end, gap_density in gaps:
+            if gap_density is None:
+                length = self.initial_window
+            else:
+                # A neighbour's density is only an estimate, so a long gap is never split into more windows
+                # than keep every worker busy; a window that turns out dense is still split while it is fetched
+                length = max(
+                    self.min_window,
+                    int(self.max_window_posts / max(gap_density, 1e-9)),
+                    (gap_end - gap_start) // (4 * self.max_workers)
+                )
+            for window_start in range(gap_start, gap_end, length):
+                window_end = min(window_start + length, gap_end)
+                if gap_density is None:
+                    # Windows of unknown density are assumed to be full
+                    estimate = self.max_window_posts * (window_end - window_start) / self.initial_window
+                else:
+                    estimate = gap_density * (window_end - window_start)
+                windows.append((window_start - 1, window_end, estimate))
+
+        return windows
+
     def _finder_process(
             self,
+            windows: PriorityQueue,
             start_date: int,
             end_date: int,
             subreddit: str,
             limit: int
     ) -> None:
-        """Extract the posts for a specific date.
+        """Fetch the posts for a time window and queue them for writing.
+
+        Once a window yields more than max_window_posts posts, the rest of it is split in two and
+        queued with a size estimate based on the density seen so far.
+        A failed window is fetched again from the start; posts already written are skipped on insert.
 
+        :param windows: The priority queue of windows left to fetch
         :param start_date: The start date as a Unix timestamp
         :param end_date: The end date as a Unix timestamp
         :param subreddit: The name of the subreddit to search
         :param limit: The maximum number of posts to retrieve
         :return: None
         """
-        generator = self._get_generator(
-            start_date,
-            end_date,
-            subreddit,
-            limit
-        )
+        def fetch():
+            generator = self._get_generator(
+                start_date,
+                end_date,
+                subreddit,
+                limit
+            )
+
+            count = 0
+            for post in self._paced(generator):
+                submission_id = post.id
+                title = post.title
+                text = post.selftext
+                author = post.author.name if post.author else None
+                num_comments = post.num_comments
+                created_at = datetime.utcfromtimestamp(post.created_utc)
+
+                self.rows.put((submission_id, title, text, author, num_comments, created_at))
+                count += 1
+
+                split = int(post.created_utc)
+                if count >= self.max_window_posts and end_date - split > 2 * self.min_window:
+                    return count, split
+
+            return count, end_date
+
+        window = f"{datetime.utcfromtimestamp(start_date):%Y-%m-%d %H:%M} to {datetime.utcfromtimestamp(end_date):%Y-%m-%d %H:%M}"
+        try:
+            count, fetched_until = with_retries(fetch)
+        except Exception:
+            logging.exception(f"Could not process {window}")
+            collector.inc("rows_failed", stage="extract_posts")
+            return
+
+        if fetched_until < end_date:
+            # Pushshift's bounds are exclusive, so both halves start a second early; posts created in
+            # the same second as a boundary are fetched twice and skipped on insert
+            density = count / max(1, fetched_until - start_date)
+            middle = (fetched_until + end_date) // 2
+            for split_start, split_end in ((fetched_until - 1, middle), (middle - 1, end_date)):
+                windows.put((-density * (split_end - split_start), split_start, split_end))
+
+        self.rows.put(partial(self._record_window, subreddit, start_date, fetched_until, count))
+        collector.inc("rows_done", count, stage="extract_posts")
+        if collector.sample("extract_posts", every=10):
+            logging.debug(f"Processed {count} posts from {window}")
+
+    def _window_worker(self, windows: PriorityQueue, subreddit: str, limit: Optional[int]) -> None:
+        """Fetch windows from a priority queue, largest first, until a sentinel is received.
 
-        for post in generator:
-            submission_id = post.id
-            title = post.title
-            text = post.selftext
-            author = post.author.name if post.author else None
-            num_comments = post.num_comments
-            created_at = datetime.utcfromtimestamp(post.created_utc)
-
-            conn = self.pool.getconn()
-            cur = conn.cursor()
-
-            query = """
-                        INSERT INTO POSTS
-                            (id, title, post_text, author, num_comments, created_at)
-                        VALUES
-                            (%s, %s, %s, %s, %s, %s)
-                        """
-            cur.execute(query, (submission_id, title, text, author, num_comments, created_at))
-            conn.commit()
-            self.pool.putconn(conn)
-
-        logging.info(f"Processed {datetime.utcfromtimestamp(start_date).strftime('%Y-%m-%d')}")
+        :param windows: The priority queue of (negated size estimate, start, end) windows
+        :param subreddit: The name of the subreddit to search
+        :param limit: The maximum number of posts to retrieve per window
+        :return: None
+        """
+        while True:
+            _, start, end = windows.get()
+            collector.set_gauge("queue_depth", windows.qsize(), queue="post_windows")
+            try:
+                if start == end == -1:
+                    return
+                if self.writer.error:
+                    # Nothing more can be written, so the remaining windows are left for the next run
+                    continue
+                if self.throttle:
+                    self.throttle()
+                self._finder_process(windows, start, end, subreddit, limit)
+            finally:
+                windows.task_done()
 
     def find_all(
             self,
@@ -138,23 +327,50 @@ class PostExtractor:
     ) -> None:
         """Find all posts in a specified time range, and insert it into a Postgres database.
 
+        Windows extracted by earlier runs are skipped, so an interrupted backfill resumes where it stopped.
+        The month partitions of the range are created before any post is written.
+
         :param start_date: The start date in the form YYYY-MM-DD
         :param end_date: The end date in the form YYYY-MM-DD
         :param subreddit: The name of the subreddit to search
         :param limit: The maximum number of posts to process
         :return: None
         """
-        start_date_dt = datetime.fromisoformat(start_date)
-        end_date_dt = datetime.fromisoformat(end_date)
-
-        all_dates = self._get_all_dates_in_range(start_date_dt, end_date_dt)
-
-        with ThreadPoolExecutor() as executor:
-            for start, end in pairwise(all_dates):
-                executor.submit(
-                    self._finder_process,
-                    start,
-                    end,
-                    subreddit,
-                    limit
-                )
+        start = self._str_to_unix_timestamp(datetime.fromisoformat(start_date))
+        end = self._str_to_unix_timestamp(datetime.fromisoformat(end_date))
+
+        # A day either side covers posts near the ends of the range whatever the local time zone
+        create_month_partitions(
+            self.pool,
+            "posts",
+            datetime.fromisoformat(start_date).date() - timedelta(days=1),
+            datetime.fromisoformat(end_date).date() + timedelta(days=1)
+        )
+
+        windows = PriorityQueue()
+        for window_start, window_end, estimate in self._get_pending_windows(start, end, subreddit):
+            windows.put((-estimate, window_start, window_end))
+
+        columns = ["id", "title", "post_text", "author", "num_comments", "created_at"]
+        # Posts are partitioned by month, so ids are only unique together with created_at
+        self.writer = BulkWriter(self.pool, "posts", columns, key_columns=["id", "created_at"])
+        writer = Thread(target=self.writer.consume, args=(self.rows,))
+        writer.start()
+
+        workers = [
+            Thread(target=self._window_worker, args=(windows, subreddit, limit))
+            for _ in range(self.max_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        windows.join()
+        for _ in workers:
+            windows.put((float("inf"), -1, -1))
+        for worker in workers:
+            worker.join()
+
+        self.rows.put(None)
+        writer.join()
+        if self.writer.error:
+            raise self.writer.error
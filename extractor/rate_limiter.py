@@ -0,0 +1,106 @@
+from threading import Lock
+import logging
+from random import uniform
+from time import monotonic, sleep
+from typing import Callable, Optional, TypeVar
+
+import prawcore
+import requests
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Dropped connections and timeouts, which carry no response; requests and prawcore do not raise the builtin ones
+RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    prawcore.exceptions.RequestException
+)
+
+
+class TokenBucket:
+    """A thread-safe token bucket shared by every request made to an API."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize a TokenBucket.
+
+        :param rate: The number of requests allowed per second
+        :param capacity: The largest burst of requests allowed, defaulting to one second's worth
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until the requested number of tokens are available, then take them.
+
+        :param tokens: The number of tokens to take
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait = (tokens - self._tokens) / self.rate
+
+            sleep(wait)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Get the HTTP status code of a failed request, if it has one.
+
+    :param error: The raised exception
+    :return: The status code, or None if the exception did not come from an HTTP response
+    """
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed request should be retried.
+
+    :param error: The raised exception
+    :return: True for rate limiting, server errors and dropped connections
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def with_retries(
+        func: Callable[[], T],
+        retries: int = 5,
+        backoff: float = 2.0,
+        max_backoff: float = 120.0
+) -> T:
+    """Call a function, retrying with jittered exponential backoff on retryable errors.
+
+    :param func: The function to call
+    :param retries: The maximum number of retries
+    :param backoff: The delay in seconds before the first retry, doubled after each one
+    :param max_backoff: The longest delay between retries
+    :return: The return value of the function
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+
+            delay = min(max_backoff, backoff * 2 ** attempt) * uniform(0.5, 1.0)
+            logging.warning(f"Request failed with {error!r}, retrying in {delay:.1f}s")
+            sleep(delay)
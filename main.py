@@ -1,24 +1,59 @@
+import argparse
 import os
 import logging
+from typing import List, Optional
 
 from dotenv import load_dotenv
 import praw
 from psaw import PushshiftAPI
 from psycopg2.pool import ThreadedConnectionPool
 
+from db.migrate import check_current
 from extractor.comment_extractor import CommentExtractor
 from extractor.post_extractor import PostExtractor
+from extractor.rate_limiter import TokenBucket
+from metrics.exporter import SnapshotWriter, serve
+from pipeline.orchestrator import Backlog, Orchestrator, parse_stages
 from sentiment.comment_adder import CommentAdder
 from sentiment.post_adder import PostAdder
+from tagging.symbol_tagger import SymbolTagger
 
 load_dotenv()
 
 
-def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract, tag and score r/wallstreetbets posts and comments.")
+    parser.add_argument("--stages", default="all",
+                        help="A comma separated list of stages: extract, score, rescore, all, or extract_posts, "
+                             "extract_comments, tag, score_posts, score_comments, rescore_posts and rescore_comments")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SENTIMENT_WORKERS", "0")),
+                        help="The number of scoring processes per table, or 0 to score in this process")
+    parser.add_argument("--backend", default=os.getenv("ROBERTA_BACKEND", "torch"),
+                        help="The roBERTa inference backend: torch, onnx or onnx-int8")
+    parser.add_argument("--token-store", default=os.getenv("TOKEN_STORE_DIR") or None,
+                        help="The directory token ids are persisted in while scoring and read from when rescoring")
+    parser.add_argument("--start-date", default="2020-12-01", help="The first day of posts to extract")
+    parser.add_argument("--end-date", default="2022-01-01", help="The day after the last day of posts to extract")
+    parser.add_argument("--max-backlog", type=int, default=50000,
+                        help="The number of unscored rows above which extraction pauses")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                        help="The number of seconds an idle stage waits before looking for new work")
+    args = parser.parse_args(argv)
+
+    try:
+        args.stages = parse_stages(args.stages)
+    except ValueError as error:
+        parser.error(str(error))
+
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
     logging.basicConfig(
         level=logging.INFO,
         format="[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s"
     )
+    args = parse_args(argv)
 
     client_id = os.getenv("PRAW_CLIENT_ID")
     client_secret = os.getenv("PRAW_SECRET")
@@ -35,25 +70,69 @@ def main():
     password = os.getenv("PG_PASSWORD")
     database = os.getenv("PG_DATABASE")
 
+    # Concurrent stages each hold a few connections for streaming, writing and checkpoints
     pool = ThreadedConnectionPool(
         minconn=1,
-        maxconn=10,
+        maxconn=10 + 4 * len(args.stages),
         user=user,
         password=password,
         database=database
     )
 
-    extractor = PostExtractor(api, pool)
-    extractor.find_all("2020-12-01", "2022-01-01")
+    # Scoring casts to the sentiment_label enum and extraction writes to month partitions
+    conn = pool.getconn()
+    check_current(conn)
+    conn.commit()
+    pool.putconn(conn)
+
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        serve(int(metrics_port))
+
+    snapshot_writer = None
+    snapshot_path = os.getenv("METRICS_SNAPSHOT_PATH")
+    if snapshot_path:
+        snapshot_writer = SnapshotWriter(snapshot_path, float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "30"))).start()
+
+    pushshift_limiter = TokenBucket(rate=float(os.getenv("PUSHSHIFT_REQUESTS_PER_SECOND", "1")))
+    reddit_limiter = TokenBucket(rate=float(os.getenv("REDDIT_REQUESTS_PER_SECOND", "1.66")))
+
+    post_adder = PostAdder(pool, backend=args.backend, token_store_dir=args.token_store)
+    comment_adder = CommentAdder(pool, backend=args.backend, token_store_dir=args.token_store)
+
+    adders = []
+    if "score_posts" in args.stages:
+        adders.append(post_adder)
+    if "score_comments" in args.stages:
+        adders.append(comment_adder)
+    backlog = Backlog(adders, args.max_backlog) if adders else None
+    throttle = backlog.wait if backlog else None
 
-    extractor = CommentExtractor(client, pool)
-    extractor.find_all()
+    post_extractor = PostExtractor(api, pool, pushshift_limiter, throttle=throttle)
+    comment_extractor = CommentExtractor(client, pool, reddit_limiter, throttle=throttle)
+    tagger = SymbolTagger(pool)
 
-    post_adder = PostAdder(pool)
-    post_adder.apply_sentiment()
+    runs = {
+        "extract_posts": lambda: post_extractor.find_all(args.start_date, args.end_date),
+        "extract_comments": comment_extractor.find_all,
+        "tag": tagger.tag_all,
+        "score_posts": lambda: post_adder.apply_sentiment(workers=args.workers),
+        "score_comments": lambda: comment_adder.apply_sentiment(workers=args.workers),
+        "rescore_posts": post_adder.rescore,
+        "rescore_comments": comment_adder.rescore
+    }
 
-    comment_adder = CommentAdder(pool)
-    comment_adder.apply_sentiment()
+    try:
+        orchestrator = Orchestrator(
+            {stage: runs[stage] for stage in args.stages},
+            poll_interval=args.poll_interval,
+            backlog=backlog
+        )
+        orchestrator.run()
+    finally:
+        if snapshot_writer:
+            snapshot_writer.stop()
+        pool.closeall()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+"""Collects counters, gauges and timers for every stage of the pipeline in this process.
+
+Metrics are identified by a name and a set of labels, like Prometheus metrics, and are cheap
+enough to update per row. Use metrics.exporter to expose them.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Dict, Generator, List, Optional, Tuple
+
+# Upper bounds of the timer histogram buckets in seconds
+BUCKETS: List[float] = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0]
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Timer:
+    """Accumulates the count, sum, maximum and bucket counts of observed durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+
+_counters: Dict[MetricKey, float] = {}
+_gauges: Dict[MetricKey, float] = {}
+_timers: Dict[MetricKey, Timer] = {}
+_totals: Dict[str, Tuple[float, float, float]] = {}
+_samples: Dict[str, int] = {}
+_lock = Lock()
+_started = monotonic()
+
+
+def _key(name: str, labels: Dict[str, object]) -> MetricKey:
+    """Build the key a metric is stored under.
+
+    :param name: The name of the metric
+    :param labels: The labels of the metric
+    :return: The name with the labels sorted by label name
+    """
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Increase a counter.
+
+    :param name: The name of the counter
+    :param amount: The amount to add
+    :param labels: The labels of the counter
+    :return: None
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to its current value.
+
+    :param name: The name of the gauge
+    :param value: The current value
+    :param labels: The labels of the gauge
+    :return: None
+    """
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record a duration.
+
+    :param name: The name of the timer
+    :param seconds: The duration in seconds
+    :param labels: The labels of the timer
+    :return: None
+    """
+    key = _key(name, labels)
+    with _lock:
+        if key not in _timers:
+            _timers[key] = Timer()
+        _timers[key].observe(seconds)
+
+
+@contextmanager
+def timer(name: str, **labels) -> Generator[None, None, None]:
+    """Record how long a block takes to run.
+
+    :param name: The name of the timer
+    :param labels: The labels of the timer
+    :return: A context manager
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, perf_counter() - start, **labels)
+
+
+def set_total(stage: str, total: float) -> None:
+    """Set the number of rows a stage has to process, so that its ETA can be estimated.
+
+    Progress is measured by the rows_done counter of the stage from the time this is called.
+
+    :param stage: The name of the stage
+    :param total: The number of rows left to process
+    :return: None
+    """
+    done = get_counter("rows_done", stage=stage)
+    with _lock:
+        _totals[stage] = (done + total, monotonic(), done)
+
+
+def get_counter(name: str, **labels) -> float:
+    """Get the value of a counter.
+
+    :param name: The name of the counter
+    :param labels: The labels of the counter
+    :return: The value, or 0 if the counter has not been increased
+    """
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def sample(key: str, every: int = 100) -> bool:
+    """Decide whether to log an event that happens once per row, by logging every nth one.
+
+    :param key: The kind of event
+    :param every: The number of events per logged event
+    :return: True for the first event and every nth one after it
+    """
+    with _lock:
+        count = _samples.get(key, 0)
+        _samples[key] = count + 1
+
+    return count % every == 0
+
+
+def _eta(stage: str, total: float, since: float, done_before: float, now: float) -> Dict[str, Optional[float]]:
+    """Estimate when a stage will finish from its average rate since its total was set.
+
+    :param stage: The name of the stage
+    :param total: The number of rows the stage has to process, including rows done before the total was set
+    :param since: The time the total was set
+    :param done_before: The number of rows done when the total was set
+    :param now: The current time
+    :return: The progress of the stage
+    """
+    done = _counters.get(_key("rows_done", {"stage": stage}), 0)
+    elapsed = now - since
+    rate = (done - done_before) / elapsed if elapsed > 0 else None
+
+    return {
+        "total": total,
+        "done": done,
+        "rows_per_sec": rate,
+        "eta_seconds": max(total - done, 0) / rate if rate else None
+    }
+
+
+def snapshot() -> dict:
+    """Get the current value of every metric.
+
+    :return: A JSON serializable dictionary of counters, gauges, timers and stage progress
+    """
+    def labelled(key: MetricKey) -> dict:
+        name, labels = key
+        return {"name": name, "labels": dict(labels)}
+
+    now = monotonic()
+    with _lock:
+        return {
+            "uptime_seconds": now - _started,
+            "counters": [{**labelled(key), "value": value} for key, value in _counters.items()],
+            "gauges": [{**labelled(key), "value": value} for key, value in _gauges.items()],
+            "timers": [
+                {
+                    **labelled(key),
+                    "count": timer_.count,
+                    "sum": timer_.sum,
+                    "mean": timer_.sum / timer_.count if timer_.count else None,
+                    "max": timer_.max
+                }
+                for key, timer_ in _timers.items()
+            ],
+            "progress": {stage: _eta(stage, *progress, now) for stage, progress in _totals.items()}
+        }
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    """Format labels the way the Prometheus text format expects them.
+
+    :param labels: The labels of a metric
+    :param extra: Additional labels, such as a bucket bound
+    :return: The labels in braces, or an empty string
+    """
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus(prefix: str = "wsb_") -> str:
+    """Render every metric in the Prometheus text exposition format.
+
+    :param prefix: The prefix added to every metric name
+    :return: The metrics as text
+    """
+    lines = []
+    with _lock:
+        for kind, metrics in (("counter", _counters), ("gauge", _gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {prefix}{name} {kind}")
+                for (metric_name, labels), value in metrics.items():
+                    if metric_name == name:
+                        lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in _timers}):
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for (metric_name, labels), timer_ in _timers.items():
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + [float("inf")], timer_.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(labels, le=le)} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {timer_.sum}")
+                lines.append(f"{prefix}{name}_count{_format_labels(labels)} {timer_.count}")
+
+    return "\n".join(lines) + "\n"
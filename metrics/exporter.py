@@ -0,0 +1,91 @@
+"""Exposes the collected metrics over a local HTTP endpoint or as periodic JSON snapshots.
+
+``GET /metrics`` returns the Prometheus text format and ``GET /metrics.json`` the JSON snapshot.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+from threading import Event, Thread
+
+from metrics import collector
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the current metrics."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = collector.render_prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(collector.snapshot()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics request: {format % args}")
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics from a background thread.
+
+    :param port: The port to listen on
+    :param host: The address to listen on, local only by default
+    :return: The running server
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    return server
+
+
+class SnapshotWriter:
+    """Writes the JSON snapshot to a file at a fixed interval from a background thread."""
+
+    def __init__(self, path: str, interval: float = 30.0):
+        """Initialize a SnapshotWriter.
+
+        :param path: The file to write the snapshot to
+        :param interval: The number of seconds between snapshots
+        """
+        self.path = path
+        self.interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def write(self) -> None:
+        """Write the current snapshot, replacing the previous one atomically.
+
+        :return: None
+        """
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(collector.snapshot(), snapshot_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self) -> "SnapshotWriter":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop writing and write a final snapshot.
+
+        :return: None
+        """
+        self._stop.set()
+        self._thread.join()
+        self.write()
@@ -0,0 +1,205 @@
+"""Runs the pipeline stages concurrently instead of one after another.
+
+Stages hand work to each other through the database: new posts wait in the posts table for comment
+extraction, and unscored rows are found through the partial unscored indexes. Each stage works through
+what is pending, then polls for more until every stage upstream of it has finished, and ends with
+one last pass. Extraction is paused while the scoring backlog is too large, so a fast crawler cannot
+run arbitrarily far ahead of a slow scorer.
+"""
+import logging
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Optional
+
+from metrics import collector
+from sentiment.sentiment_base import SentimentBase
+
+STAGES = ["extract_posts", "extract_comments", "tag", "score_posts", "score_comments", "rescore_posts", "rescore_comments"]
+
+ALIASES = {
+    "extract": ["extract_posts", "extract_comments"],
+    "score": ["score_posts", "score_comments"],
+    "rescore": ["rescore_posts", "rescore_comments"],
+    "all": ["extract_posts", "extract_comments", "tag", "score_posts", "score_comments"]
+}
+
+# The stages whose output each stage consumes
+UPSTREAM = {
+    "extract_posts": [],
+    "extract_comments": ["extract_posts"],
+    "tag": ["extract_posts", "extract_comments"],
+    "score_posts": ["extract_posts"],
+    "score_comments": ["extract_comments"],
+    "rescore_posts": [],
+    "rescore_comments": []
+}
+
+# The counters that show a stage made progress, as (metric name, labels) pairs. Scoring counts texts that
+# were scored rather than rows read, since rows that fail to score are read again on every pass
+PROGRESS = {
+    "extract_posts": [("rows_done", {"stage": "extract_posts"})],
+    "extract_comments": [("rows_done", {"stage": "extract_comments"})],
+    "tag": [("rows_done", {"stage": "tag_posts"}), ("rows_done", {"stage": "tag_comments"})],
+    "score_posts": [("texts_scored", {"table": "posts"})],
+    "score_comments": [("texts_scored", {"table": "comments"})],
+    "rescore_posts": [("rows_done", {"stage": "rescore_posts"})],
+    "rescore_comments": [("rows_done", {"stage": "rescore_comments"})]
+}
+
+
+def parse_stages(text: str) -> List[str]:
+    """Parse a comma separated list of stages and aliases.
+
+    :param text: A list such as extract,score
+    :return: The selected stages in pipeline order
+    """
+    selected = set()
+    for name in filter(None, (name.strip() for name in text.split(","))):
+        if name in ALIASES:
+            selected.update(ALIASES[name])
+        elif name in STAGES:
+            selected.add(name)
+        else:
+            raise ValueError(f"Unknown stage {name}, expected one of {', '.join(list(ALIASES) + STAGES)}")
+
+    return [stage for stage in STAGES if stage in selected]
+
+
+class Backlog:
+    """Blocks producers while too many rows are waiting to be scored."""
+
+    def __init__(self, adders: List[SentimentBase], max_rows: int, interval: float = 10.0):
+        """Initialize a Backlog.
+
+        :param adders: The scorers whose unscored rows make up the backlog
+        :param max_rows: The number of unscored rows above which producers wait
+        :param interval: The number of seconds between counts of the backlog
+        """
+        self.adders = adders
+        self.max_rows = max_rows
+        self.interval = interval
+
+        self.rows = 0
+        self.released = False
+        self._counted = None
+        self._lock = Lock()
+
+    def _count(self) -> int:
+        """Count the unscored rows, at most once per interval across every producer.
+
+        :return: The number of unscored rows
+        """
+        with self._lock:
+            if self._counted is None or monotonic() - self._counted >= self.interval:
+                self.rows = sum(adder._count_pending(None) for adder in self.adders)
+                self._counted = monotonic()
+                collector.set_gauge("backlog_rows", self.rows)
+
+            return self.rows
+
+    def release(self) -> None:
+        """Stop blocking producers, once nothing is left to score the backlog.
+
+        :return: None
+        """
+        self.released = True
+
+    def wait(self) -> None:
+        """Block until the backlog is no larger than max_rows.
+
+        :return: None
+        """
+        logged = False
+        while not self.released and self._count() > self.max_rows:
+            if not logged:
+                logging.info(f"Pausing extraction while {self.rows} rows wait to be scored")
+                logged = True
+            collector.inc("backpressure_waits")
+            sleep(self.interval)
+
+
+class Orchestrator:
+    """Runs each selected stage on its own thread until the stages upstream of it have finished."""
+
+    def __init__(
+            self,
+            runs: Dict[str, Callable[[], None]],
+            poll_interval: float = 30.0,
+            backlog: Optional[Backlog] = None
+    ):
+        """Initialize an Orchestrator.
+
+        :param runs: A function per selected stage that processes everything currently pending
+        :param poll_interval: The number of seconds an idle stage waits before looking for new work
+        :param backlog: The backlog extraction waits on, released once every scoring stage has finished
+        """
+        self.runs = runs
+        self.poll_interval = poll_interval
+        self.backlog = backlog
+
+        self.finished = set()
+        self.failed = []
+        self._changed = Condition()
+
+    def _progress(self, stage: str) -> float:
+        """Get the amount of work a stage has completed so far.
+
+        :param stage: The name of the stage
+        :return: The number of rows or texts
+        """
+        return sum(collector.get_counter(name, **labels) for name, labels in PROGRESS[stage])
+
+    def _upstream_finished(self, stage: str) -> bool:
+        """Check whether every selected stage a stage consumes from has finished.
+
+        Stages that were not selected count as finished, so the stage works through what is already stored.
+
+        :param stage: The name of the stage
+        :return: True if nothing new can arrive
+        """
+        with self._changed:
+            return all(upstream in self.finished or upstream not in self.runs for upstream in UPSTREAM[stage])
+
+    def _run_stage(self, stage: str) -> None:
+        """Run a stage repeatedly until a pass that started after its upstream stages finished.
+
+        :param stage: The name of the stage
+        :return: None
+        """
+        try:
+            while True:
+                final = self._upstream_finished(stage)
+                before = self._progress(stage)
+
+                self.runs[stage]()
+
+                if final:
+                    return
+                if self._progress(stage) == before:
+                    with self._changed:
+                        self._changed.wait(self.poll_interval)
+        except Exception:
+            logging.exception(f"Stage {stage} failed")
+            self.failed.append(stage)
+        finally:
+            logging.info(f"Stage {stage} finished")
+            with self._changed:
+                self.finished.add(stage)
+                self._changed.notify_all()
+                scoring = [name for name in ALIASES["score"] if name in self.runs]
+                if self.backlog and all(name in self.finished for name in scoring):
+                    self.backlog.release()
+
+    def run(self) -> None:
+        """Run every selected stage concurrently and wait for all of them to finish.
+
+        :return: None
+        """
+        threads = [Thread(target=self._run_stage, args=(stage,), name=stage) for stage in self.runs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.failed:
+            raise RuntimeError(f"Stages failed: {', '.join(self.failed)}")
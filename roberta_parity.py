@@ -0,0 +1,55 @@
+"""Compare the labels of a roBERTa backend against the fp32 PyTorch model on a sample of comments."""
+import argparse
+import os
+from time import perf_counter
+
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+from sentiment.comment_adder import CommentAdder
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", default="onnx-int8", help="The backend to compare: onnx or onnx-int8")
+    parser.add_argument("--sample", type=int, default=2000, help="The number of comments to compare on")
+    args = parser.parse_args()
+
+    pool = ThreadedConnectionPool(
+        minconn=1,
+        maxconn=2,
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        database=os.getenv("PG_DATABASE")
+    )
+
+    conn = pool.getconn()
+    cur = conn.cursor()
+    cur.execute("SELECT body FROM comments WHERE body IS NOT NULL ORDER BY RANDOM() LIMIT %s", (args.sample,))
+    texts = [row[0] for row in cur.fetchall()]
+    pool.putconn(conn)
+
+    reference = CommentAdder(pool, cache_size=None, backend="torch")
+    candidate = CommentAdder(pool, cache_size=None, backend=args.backend)
+
+    start = perf_counter()
+    reference_labels = reference._calculate_roberta_batch(texts)
+    reference_time = perf_counter() - start
+
+    start = perf_counter()
+    candidate_labels = candidate._calculate_roberta_batch(texts)
+    candidate_time = perf_counter() - start
+
+    agreement = sum(a == b for a, b in zip(reference_labels, candidate_labels)) / len(texts)
+
+    print(f"Compared {len(texts)} comments")
+    print(f"Label agreement with torch fp32: {agreement:.2%}")
+    print(f"torch: {reference_time:.1f}s, {args.backend}: {candidate_time:.1f}s ({reference_time / candidate_time:.1f}x)")
+
+    pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
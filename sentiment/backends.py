@@ -0,0 +1,167 @@
+"""Inference backends that turn tokenized text into roBERTa logits.
+
+The PyTorch backend runs the fp32 Hugging Face model. The ONNX backends export that model once,
+optionally quantize its weights to int8, and run it with onnxruntime, which is considerably faster on CPUs.
+"""
+import logging
+import os
+from typing import Dict, Optional
+from uuid import uuid4
+
+import numpy as np
+import torch
+from transformers import AutoModelForSequenceClassification
+
+
+class TorchBackend:
+    """Runs the fp32 PyTorch model."""
+
+    def __init__(self, model_name: str):
+        """Initialize a TorchBackend.
+
+        :param model_name: The name or local path of the Hugging Face model
+        """
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        self.model.eval()
+
+    def logits(self, encoded_input: Dict) -> np.ndarray:
+        """Run a forward pass.
+
+        :param encoded_input: A tokenized batch of int64 NumPy arrays, shared with PyTorch without copying
+        :return: An (n, labels) array of logits
+        """
+        inputs = {name: torch.from_numpy(array) for name, array in encoded_input.items()}
+        with torch.inference_mode():
+            return self.model(**inputs)[0].numpy()
+
+
+class OnnxBackend:
+    """Runs an exported ONNX model, optionally with dynamically quantized int8 weights."""
+
+    def __init__(
+            self,
+            model_name: str,
+            model_dir: str = "./models",
+            quantized: bool = False,
+            model_id: Optional[str] = None
+    ):
+        """Initialize an OnnxBackend, exporting the model first if it has not been already.
+
+        :param model_name: The name or local path of the Hugging Face model
+        :param model_dir: The directory exported models are stored in
+        :param quantized: Whether to run the int8 quantized model
+        :param model_id: An identifier of the model's weights that exports are stored under, defaulting to model_name
+        """
+        from onnxruntime import InferenceSession, SessionOptions
+
+        model_path = self.prepare(model_name, model_dir, quantized, model_id)
+
+        options = SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    @classmethod
+    def prepare(
+            cls,
+            model_name: str,
+            model_dir: str = "./models",
+            quantized: bool = False,
+            model_id: Optional[str] = None
+    ) -> str:
+        """Export and quantize a model unless that has been done already.
+
+        Exports are stored under the model's identifier, so replacing the weights in a local directory
+        exports them again instead of running the stale export.
+
+        :param model_name: The name or local path of the Hugging Face model
+        :param model_dir: The directory exported models are stored in
+        :param quantized: Whether to quantize the model
+        :param model_id: An identifier of the model's weights that exports are stored under, defaulting to model_name
+        :return: The path of the model to run
+        """
+        base_path = os.path.join(model_dir, (model_id or model_name).replace("/", "__"))
+        model_path = f"{base_path}.onnx"
+        if not os.path.exists(model_path):
+            cls._export(model_name, model_path)
+
+        if quantized:
+            quantized_path = f"{base_path}-int8.onnx"
+            if not os.path.exists(quantized_path):
+                cls._quantize(model_path, quantized_path)
+            model_path = quantized_path
+
+        return model_path
+
+    @staticmethod
+    def _export(model_name: str, model_path: str) -> None:
+        """Export a Hugging Face model to ONNX with dynamic batch and sequence axes.
+
+        The model is written to a temporary file and renamed into place, so processes exporting at
+        the same time never load a partially written model.
+
+        :param model_name: The name or local path of the Hugging Face model
+        :param model_path: The path to write the ONNX model to
+        :return: None
+        """
+        logging.info(f"Exporting {model_name} to {model_path}")
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+
+        dummy_input = torch.ones((1, 8), dtype=torch.long)
+        dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}
+        temporary_path = f"{model_path}.{uuid4().hex}.tmp"
+        torch.onnx.export(
+            model,
+            (dummy_input, dummy_input),
+            temporary_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={**dynamic_axes, "logits": {0: "batch"}},
+            opset_version=14
+        )
+        os.replace(temporary_path, model_path)
+
+    @staticmethod
+    def _quantize(model_path: str, quantized_path: str) -> None:
+        """Quantize the weights of an ONNX model to int8, renaming the result into place once it is written.
+
+        :param model_path: The path of the fp32 ONNX model
+        :param quantized_path: The path to write the quantized model to
+        :return: None
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logging.info(f"Quantizing {model_path} to {quantized_path}")
+        temporary_path = f"{quantized_path}.{uuid4().hex}.tmp"
+        quantize_dynamic(model_path, temporary_path, weight_type=QuantType.QInt8)
+        os.replace(temporary_path, quantized_path)
+
+    def logits(self, encoded_input: Dict) -> np.ndarray:
+        """Run a forward pass.
+
+        :param encoded_input: A tokenized batch of NumPy arrays
+        :return: An (n, labels) array of logits
+        """
+        inputs = {name: encoded_input[name].astype(np.int64, copy=False) for name in self.input_names}
+        return self.session.run(["logits"], inputs)[0]
+
+
+def load_backend(backend: str, model_name: str, model_id: Optional[str] = None):
+    """Load an inference backend by name.
+
+    :param backend: One of torch, onnx or onnx-int8
+    :param model_name: The name or local path of the Hugging Face model
+    :param model_id: An identifier of the model's weights that ONNX exports are stored under
+    :return: An initialized backend
+    """
+    if backend == "torch":
+        return TorchBackend(model_name)
+    elif backend == "onnx":
+        return OnnxBackend(model_name, model_id=model_id)
+    elif backend == "onnx-int8":
+        return OnnxBackend(model_name, quantized=True, model_id=model_id)
+    else:
+        raise ValueError(f"Unknown roBERTa backend {backend}, expected torch, onnx or onnx-int8")
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class SentimentCache:
+    """Caches sentiment labels by a hash of the scored text.
+
+    Lookups go through an in-process LRU first and fall back to the sentiment_cache table,
+    so duplicate texts are only scored once across posts, comments and runs.
+    """
+
+    def __init__(self, pool: ThreadedConnectionPool, model_name: str, max_size: int = 100000):
+        """Initialize a SentimentCache.
+
+        :param pool: An initialized thread-safe Postgres connection pool
+        :param model_name: The identifier of the roBERTa weights and backend the labels come from
+        :param max_size: The maximum number of entries kept in memory
+        """
+        self.pool = pool
+        self.model_name = model_name
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        """Get the cache key of a text.
+
+        :param text: The text to hash
+        :return: The hex digest of the text with surrounding whitespace removed
+        """
+        return sha256(text.strip().encode("utf-8")).hexdigest()
+
+    def _remember(self, entries: Dict[str, Tuple[str, str]]) -> None:
+        """Add entries to the in-memory tier, evicting the least recently used ones.
+
+        :param entries: A mapping of keys to (vader, roberta) labels
+        :return: None
+        """
+        with self._lock:
+            for key, labels in entries.items():
+                self._entries[key] = labels
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Tuple[str, str]]:
+        """Look up the labels of many keys.
+
+        :param keys: The keys to look up
+        :return: A mapping of the keys that were found to their (vader, roberta) labels
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+
+        remaining = list({key for key in keys if key not in found})
+        if remaining:
+            query = """
+                    SELECT text_hash, vader_score, roberta_score
+                    FROM sentiment_cache
+                    WHERE model_name = %s
+                    AND text_hash = ANY(%s)
+                    """
+            conn = self.pool.getconn()
+            cur = conn.cursor()
+            cur.execute(query, (self.model_name, remaining))
+            stored = {key: (vader_score, roberta_score) for key, vader_score, roberta_score in cur.fetchall()}
+            conn.commit()
+            self.pool.putconn(conn)
+
+            self._remember(stored)
+            found.update(stored)
+
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return found
+
+    def put_many(self, entries: Dict[str, Tuple[str, str]]) -> None:
+        """Store the labels of newly scored texts.
+
+        :param entries: A mapping of keys to (vader, roberta) labels
+        :return: None
+        """
+        if not entries:
+            return
+
+        self._remember(entries)
+
+        query = """
+                INSERT INTO sentiment_cache
+                    (text_hash, model_name, vader_score, roberta_score)
+                VALUES %s
+                ON CONFLICT (text_hash, model_name) DO NOTHING
+                """
+        rows = [(key, self.model_name, vader_score, roberta_score) for key, (vader_score, roberta_score) in entries.items()]
+
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        execute_values(cur, query, rows, page_size=len(rows))
+        conn.commit()
+        self.pool.putconn(conn)
+
+    def hit_rate(self) -> float:
+        """Get the fraction of lookups answered by the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,20 +1,28 @@
-from concurrent.futures import ThreadPoolExecutor
-import logging
-
 from sentiment.sentiment_base import SentimentBase
+from sentiment.worker_pool import run_workers
 
 
 class CommentAdder(SentimentBase):
     """Adds sentiment scores to comments stored in a Postgres database."""
+    table = "comments"
+    columns = ["body"]
 
-    def apply_sentiment(self):
-        """Apply sentiment values to comments stored in the database."""
-        query = "SELECT id, body FROM comments"
+    def apply_sentiment(
+            self,
+            chunk_size: int = 256,
+            workers: int = 0,
+            range_size: int = 10000,
+            page_size: int = 10000
+    ):
+        """Apply sentiment values to comments that are new or failed to score.
 
-        data = self._retrieve_data(query)
-        columns = ["body"]
+        :param chunk_size: The number of rows scored together
+        :param workers: The number of worker processes, or 0 to score with threads in this process
+        :param range_size: The number of rows handed to a worker process at a time
+        :param page_size: The number of rows read between checkpoints when scoring in this process
+        """
+        if workers:
+            run_workers(CommentAdder, self._get_id_ranges(range_size), workers, chunk_size, self._worker_kwargs())
+            return
 
-        with ThreadPoolExecutor() as executor:
-            for _, row in data.iterrows():
-                logging.info(f"Processing {row['id']}")
-                executor.submit(self._update_row, row, columns, "comments")
+        self._score_pending(chunk_size, page_size)
@@ -0,0 +1,85 @@
+"""Maintains the daily_sentiment table of per-day, per-symbol, per-model sentiment aggregates.
+
+Triggers defined in db/daily_sentiment.sql record the dates of posts that are scored or tagged in
+daily_sentiment_dirty. Refreshing recomputes only those dates; both scoring posts and tagging refresh
+when they finish, so whichever stage finishes last leaves the aggregates current.
+"""
+from datetime import timedelta
+import logging
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# The advisory lock that serializes refreshes, so two of them never rebuild the same date at once
+REFRESH_LOCK_ID = 7206140
+
+
+def refresh_daily_sentiment(pool: ThreadedConnectionPool, full: bool = False) -> None:
+    """Recompute the aggregates of every date whose posts changed since the last refresh.
+
+    :param pool: An initialized thread-safe Postgres connection pool
+    :param full: Whether to recompute every date instead of only changed ones
+    :return: None
+    """
+    conn = pool.getconn()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (REFRESH_LOCK_ID,))
+
+    # Dirty rows are claimed by the same statement that reads them, so a row committed while this
+    # runs is either aggregated here or left for the next refresh, never deleted unseen
+    cur.execute("""
+                WITH claimed AS (
+                    DELETE FROM daily_sentiment_dirty
+                    RETURNING created_date
+                )
+                SELECT DISTINCT created_date FROM claimed
+                """)
+    dates = [result[0] for result in cur.fetchall()]
+
+    if full:
+        cur.execute("SELECT DISTINCT created_at::date FROM posts")
+        dates = [result[0] for result in cur.fetchall()]
+
+    if dates:
+        cur.execute("DELETE FROM daily_sentiment WHERE created_date = ANY(%s)", (dates,))
+        query = """
+                INSERT INTO daily_sentiment
+                    (created_date, symbol, model, score_column, num_posts,
+                     num_negative, num_neutral, num_positive, mean_score)
+                SELECT
+                    posts.created_at::date AS created_date,
+                    xr.symbol,
+                    scores.model,
+                    scores.score_column,
+                    COUNT(*),
+                    COUNT(*) FILTER (WHERE scores.label = 'negative'),
+                    COUNT(*) FILTER (WHERE scores.label = 'neutral'),
+                    COUNT(*) FILTER (WHERE scores.label = 'positive'),
+                    AVG(
+                        CASE scores.label
+                            WHEN 'negative' THEN -1
+                            WHEN 'neutral' THEN 0
+                            WHEN 'positive' THEN 1
+                        END
+                    )
+                FROM posts
+                INNER JOIN posts_stocks_xref AS xr
+                    ON posts.id = xr.id
+                CROSS JOIN LATERAL (
+                    VALUES
+                        ('vader', 'title', posts.vader_score_title),
+                        ('roberta', 'title', posts.roberta_score_title),
+                        ('vader', 'post_text', posts.vader_score_post_text),
+                        ('roberta', 'post_text', posts.roberta_score_post_text)
+                ) AS scores(model, score_column, label)
+                WHERE posts.created_at >= %s
+                AND posts.created_at < %s
+                AND posts.created_at::date = ANY(%s)
+                GROUP BY created_date, xr.symbol, scores.model, scores.score_column
+                """
+        # The range bounds let Postgres skip the monthly partitions without dirty dates
+        cur.execute(query, (min(dates), max(dates) + timedelta(days=1), dates))
+
+    conn.commit()
+    pool.putconn(conn)
+
+    logging.info(f"Refreshed daily sentiment for {len(dates)} dates")
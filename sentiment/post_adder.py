@@ -1,21 +1,30 @@
-from concurrent.futures.thread import ThreadPoolExecutor
-import logging
-
-
+from sentiment.daily_aggregate import refresh_daily_sentiment
 from sentiment.sentiment_base import SentimentBase
+from sentiment.worker_pool import run_workers
 
 
 class PostAdder(SentimentBase):
     """Adds sentiment scores to posts stored in a Postgres database."""
+    table = "posts"
+    columns = ["title", "post_text"]
 
-    def apply_sentiment(self):
-        """Apply sentiment values to posts stored in the database."""
-        query = "SELECT id, title, post_text FROM posts WHERE vader_score_title IS NULL ORDER BY created_at ASC"
+    def apply_sentiment(
+            self,
+            chunk_size: int = 256,
+            workers: int = 0,
+            range_size: int = 10000,
+            page_size: int = 10000
+    ):
+        """Apply sentiment values to posts that are new or failed to score.
 
-        data = self._retrieve_data(query)
-        columns = ["title", "post_text"]
+        :param chunk_size: The number of rows scored together
+        :param workers: The number of worker processes, or 0 to score with threads in this process
+        :param range_size: The number of rows handed to a worker process at a time
+        :param page_size: The number of rows read between checkpoints when scoring in this process
+        """
+        if workers:
+            run_workers(PostAdder, self._get_id_ranges(range_size), workers, chunk_size, self._worker_kwargs())
+        else:
+            self._score_pending(chunk_size, page_size)
 
-        with ThreadPoolExecutor() as executor:
-            for _, row in data.iterrows():
-                logging.info(f"Processing {row['id']}")
-                executor.submit(self._update_row, row, columns, "posts")
+        refresh_daily_sentiment(self.pool)
@@ -0,0 +1,126 @@
+"""Loads sentiment models lazily, once per process, and shares them between adders.
+
+Heavy libraries (transformers, torch, nltk) are only imported the first time a model is needed,
+and no network access is required when the model is available locally. Set ROBERTA_MODEL_DIR to
+a directory saved with save_pretrained to load roBERTa without the Hugging Face hub.
+"""
+from hashlib import sha256
+import json
+import os
+from threading import Lock
+from typing import Callable, Dict, List
+
+ROBERTA_MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment"
+
+# The label order of the model's output, from cardiffnlp/tweeteval datasets/sentiment/mapping.txt
+ROBERTA_LABELS: List[str] = ["negative", "neutral", "positive"]
+
+_models: Dict[str, object] = {}
+_lock = Lock()
+
+
+def _get(key: str, loader: Callable[[], object]) -> object:
+    """Get a shared model, loading it on first use.
+
+    :param key: The key the model is shared under
+    :param loader: A function that loads the model
+    :return: The loaded model
+    """
+    with _lock:
+        if key not in _models:
+            _models[key] = loader()
+
+        return _models[key]
+
+
+def roberta_model_path() -> str:
+    """Get the local directory or hub name roBERTa is loaded from."""
+    return os.getenv("ROBERTA_MODEL_DIR") or ROBERTA_MODEL_NAME
+
+
+def roberta_model_id() -> str:
+    """Get an identifier of the roBERTa weights, for keying anything derived from the model's output.
+
+    A local directory is identified by its absolute path and the size and modification time of its
+    files, so pointing ROBERTA_MODEL_DIR at other weights, or replacing the weights in place, changes it.
+    """
+    path = roberta_model_path()
+    if not os.path.isdir(path):
+        return path
+
+    path = os.path.abspath(path)
+    digest = sha256()
+    for name in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+
+    return f"{path}@{digest.hexdigest()[:16]}"
+
+
+def get_vader():
+    """Get the shared VADER analyzer."""
+    def load():
+        from sentiment.vader_batch import BatchSentimentIntensityAnalyzer
+        return BatchSentimentIntensityAnalyzer()
+
+    return _get("vader", load)
+
+
+def get_tokenizer():
+    """Get the shared roBERTa tokenizer."""
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(roberta_model_path())
+
+    return _get("tokenizer", load)
+
+
+def tokenizer_id() -> str:
+    """Get an identifier of the roBERTa tokenizer that only changes when it would produce other token ids.
+
+    Models fine-tuned from the same base share an identifier wherever they are stored, so token ids
+    persisted for one can be rescored with another.
+    """
+    # Resolved outside of load, which runs while _get holds the non-reentrant lock
+    tokenizer = get_tokenizer()
+
+    def load():
+        backend = getattr(tokenizer, "backend_tokenizer", None)
+        if backend is not None:
+            # Truncation and padding are runtime settings, so only the parts that produce token ids are hashed
+            definition = json.loads(backend.to_str())
+            identity = {key: definition.get(key) for key in ("added_tokens", "normalizer", "pre_tokenizer", "model")}
+        else:
+            identity = {
+                "vocab": sorted(tokenizer.get_vocab().items()),
+                "merges": sorted((" ".join(pair), rank) for pair, rank in getattr(tokenizer, "bpe_ranks", {}).items())
+            }
+
+        digest = sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{type(tokenizer).__name__.replace('Fast', '')}-{digest[:16]}"
+
+    return _get("tokenizer_id", load)
+
+
+def get_backend(backend: str):
+    """Get a shared roBERTa inference backend.
+
+    :param backend: One of torch, onnx or onnx-int8
+    :return: The loaded backend
+    """
+    def load():
+        from sentiment.backends import load_backend
+        return load_backend(backend, roberta_model_path(), roberta_model_id())
+
+    return _get(f"backend:{backend}", load)
+
+
+def prepare_backend(backend: str) -> None:
+    """Export the roBERTa model for a backend if it needs exporting, without loading it.
+
+    :param backend: One of torch, onnx or onnx-int8
+    :return: None
+    """
+    if backend in ("onnx", "onnx-int8"):
+        from sentiment.backends import OnnxBackend
+        OnnxBackend.prepare(roberta_model_path(), quantized=backend == "onnx-int8", model_id=roberta_model_id())
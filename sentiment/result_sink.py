@@ -0,0 +1,108 @@
+from threading import Lock
+import logging
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import collector
+
+# The enum type of the score columns, created by db/migrations/001_sentiment_label_enum.sql; main.py
+# refuses to start on a database without it
+LABEL_TYPE = "sentiment_label"
+
+
+class ResultSink:
+    """Buffers calculated sentiment labels and writes them back to Postgres in batches."""
+
+    def __init__(
+            self,
+            pool: ThreadedConnectionPool,
+            table: str,
+            columns: List[str],
+            flush_size: int = 5000,
+            flush_interval: float = 30.0
+    ):
+        """Initialize a ResultSink.
+
+        :param pool: An initialized thread-safe Postgres connection pool
+        :param table: The name of the table to update
+        :param columns: The text columns that labels are calculated for
+        :param flush_size: The number of buffered rows that triggers a write
+        :param flush_interval: The number of seconds after which buffered rows are written regardless of size
+        """
+        self.pool = pool
+        self.table = table
+        self.columns = columns
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._lock = Lock()
+        self._last_flush = monotonic()
+
+    def _score_columns(self) -> List[str]:
+        """Get the names of the score columns in the order they are buffered."""
+        return [
+            f"{model}_score_{column}"
+            for column in self.columns
+            for model in ("vader", "roberta")
+        ]
+
+    def add(self, row_id: str, scores: List[Tuple[Optional[str], Optional[str]]]) -> None:
+        """Buffer the labels of a single row, writing the buffer out if it is due.
+
+        :param row_id: The ID of the row
+        :param scores: A (vader, roberta) pair per column, with None for labels that could not be calculated
+        :return: None
+        """
+        row = (row_id, *(label for pair in scores for label in pair))
+
+        with self._lock:
+            self._buffer.append(row)
+            due = (
+                len(self._buffer) >= self.flush_size
+                or monotonic() - self._last_flush >= self.flush_interval
+            )
+
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every buffered row to the database in a single statement.
+
+        Labels that are None leave the stored value untouched.
+
+        :return: None
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = monotonic()
+
+        if not rows:
+            return
+
+        score_columns = self._score_columns()
+        assignments = ",\n".join(
+            f"{column} = COALESCE(v.{column}::{LABEL_TYPE}, t.{column})" for column in score_columns
+        )
+        query = f"""
+                UPDATE {self.table} AS t
+                SET
+                    {assignments}
+                FROM (VALUES %s) AS v(id, {", ".join(score_columns)})
+                WHERE t.id = v.id
+                """
+
+        with collector.timer("db_flush_seconds", table=self.table, statement="update"):
+            conn = self.pool.getconn()
+            try:
+                cur = conn.cursor()
+                execute_values(cur, query, rows, page_size=len(rows))
+                conn.commit()
+            finally:
+                self.pool.putconn(conn)
+        collector.inc("rows_written", len(rows), table=self.table, statement="update")
+
+        logging.info(f"Wrote sentiment scores for {len(rows)} rows to {self.table}")
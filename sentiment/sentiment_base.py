@@ -5,81 +5,185 @@ VADER Sentiment Analysis: https://towardsdatascience.com/sentimental-analysis-us
 roBERTa Sentiment Analysis: https://huggingface.co/cardiffnlp/twitter-roberta-base-sentiment
 """
 from abc import ABC, abstractmethod
-import csv
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import logging
-from typing import List
-import urllib
+import os
+from threading import Lock
+from typing import Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
 
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import pandas as pd
+import numpy as np
 from psycopg2.pool import ThreadedConnectionPool
-from scipy.special import softmax
-from transformers import AutoModelForSequenceClassification
-from transformers import AutoTokenizer
-from transformers.tokenization_utils_base import BatchEncoding
+
+from metrics import collector
+from sentiment import registry
+from sentiment.cache import SentimentCache
+from sentiment.result_sink import ResultSink
+from sentiment.token_store import TokenStore
 
 
 class SentimentBase(ABC):
-    def __init__(self, pool: ThreadedConnectionPool):
+    table: str
+    columns: List[str]
+
+    def __init__(
+            self,
+            pool: ThreadedConnectionPool,
+            batch_size: int = 32,
+            flush_size: int = 5000,
+            flush_interval: float = 30.0,
+            cache_size: Optional[int] = 100000,
+            backend: str = "torch",
+            max_length: int = 512,
+            window_overlap: int = 64,
+            token_store_dir: Optional[str] = None
+    ):
         """Initialize a SentimentBase.
 
         :param pool: An initialized thread-safe Postgres connection pool
+        :param batch_size: The number of texts passed through the roBERTa model at once
+        :param flush_size: The number of scored rows buffered before they are written to the database
+        :param flush_interval: The number of seconds after which scored rows are written regardless of size
+        :param cache_size: The number of labels cached in memory, or None to disable the sentiment cache
+        :param backend: The roBERTa inference backend, one of torch, onnx or onnx-int8
+        :param max_length: The maximum number of tokens, including special tokens, the model accepts at once
+        :param window_overlap: The number of tokens shared by consecutive windows of a long text
+        :param token_store_dir: The directory token ids are persisted in for rescoring, or None to not persist them
         """
+        if not 0 <= window_overlap < max_length:
+            raise ValueError(f"window_overlap must be at least 0 and less than max_length ({max_length}), got {window_overlap}")
+
         self.pool = pool
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.window_overlap = window_overlap
+        self.sink = ResultSink(pool, self.table, self.columns, flush_size, flush_interval)
 
-        self.vader = SentimentIntensityAnalyzer()
+        self.model_name = registry.roberta_model_id()
+        self.backend_name = backend
+        self.roberta_labels = registry.ROBERTA_LABELS
 
-        self.model_name = "cardiffnlp/twitter-roberta-base-sentiment"
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
-        self.roberta_labels = self._download_roberta_mapping()
+        self.cache = SentimentCache(pool, f"{self.model_name}:{backend}", cache_size) if cache_size is not None else None
 
-    @staticmethod
-    def _download_roberta_mapping() -> List[str]:
-        """Downloads a list of sentiment labels.
+        self.token_store_dir = token_store_dir
+        self._token_stores: Dict[str, TokenStore] = {}
+        self._special_tokens: Optional[Tuple[List[int], List[int]]] = None
 
-        :return: A list of string labels
-        """
-        mapping_link = f"https://raw.githubusercontent.com/cardiffnlp/tweeteval/main/datasets/sentiment/mapping.txt"
-        with urllib.request.urlopen(mapping_link) as f:
-            html = f.read().decode("utf-8").split("\n")
-            csv_reader = csv.reader(html, delimiter="\t")
+        self.scored = 0
+        self.skipped = 0
+        self._counter_lock = Lock()
 
-        return [row[1] for row in csv_reader if len(row) > 1]
+    @property
+    def vader(self):
+        """Get the VADER analyzer, loading it on first use."""
+        return registry.get_vader()
 
-    def _preprocess(self, text: str) -> BatchEncoding:
-        """Preprocess text for use with the roBERTa model.
+    @property
+    def tokenizer(self):
+        """Get the roBERTa tokenizer, loading it on first use."""
+        return registry.get_tokenizer()
 
-        :param text: A string to preprocess
-        :return: A Pandas Series containing the preprocessed string
+    @property
+    def backend(self):
+        """Get the roBERTa inference backend, loading it on first use."""
+        return registry.get_backend(self.backend_name)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """Replace links in a text with a placeholder token.
+
+        :param text: A string to normalize
+        :return: The normalized string
         """
         tokens = []
         for token in text.split(" "):
             token = 'http' if token.startswith('http') else token
             tokens.append(token)
 
-        return self.tokenizer(" ".join(tokens), return_tensors="pt")
+        return " ".join(tokens)
 
-    def _extract_score(self, encoded_input: BatchEncoding) -> str:
-        """Extract the sentiment score from encoded roBERTa data.
+    def _preprocess(self, text: str) -> List[int]:
+        """Preprocess text for use with the roBERTa model.
 
-        :param encoded_input: An encoded row of data
-        :return: The highest probability class
+        :param text: A string to preprocess
+        :return: The token ids of the normalized string, without special tokens
         """
-        output = self.model(**encoded_input)
-        scores = output[0][0].detach().numpy()
-        scores = softmax(scores)
+        return self.tokenizer(self._normalize(text), add_special_tokens=False)["input_ids"]
+
+    def _get_special_tokens(self) -> Tuple[List[int], List[int]]:
+        """Get the special tokens the tokenizer wraps every sequence in.
+
+        :return: The token ids placed before and after a sequence
+        """
+        if self._special_tokens is None:
+            marker = -1
+            wrapped = self.tokenizer.build_inputs_with_special_tokens([marker])
+            split = wrapped.index(marker)
+            self._special_tokens = (wrapped[:split], wrapped[split + 1:])
+
+        return self._special_tokens
+
+    def _windows(self, token_ids: Sequence[int]) -> List[Sequence[int]]:
+        """Split token ids into windows the model accepts once wrapped in special tokens.
+
+        Texts longer than the model accepts are split into overlapping windows
+        instead of being truncated, so the end of a long post is still scored.
+
+        :param token_ids: The token ids of a text, a list or a NumPy view
+        :return: One or more slices of the token ids
+        """
+        prefix, suffix = self._get_special_tokens()
+        window = self.max_length - len(prefix) - len(suffix)
+        stride = window - self.window_overlap
+        # The special tokens are only known once the tokenizer is loaded, so this is checked here too
+        if stride <= 0:
+            raise ValueError(
+                f"window_overlap must be less than the {window} tokens of a window, got {self.window_overlap}"
+            )
+
+        starts = range(0, max(len(token_ids) - self.window_overlap, 1), stride)
+        return [token_ids[i:i + window] for i in starts]
+
+    def _pad(self, windows: List[Sequence[int]]) -> Dict[str, np.ndarray]:
+        """Wrap windows in special tokens and pad them into one batch.
+
+        Token ids are copied straight from lists or memory-mapped views into the batch arrays.
+
+        :param windows: Windows of token ids without special tokens
+        :return: The input_ids and attention_mask arrays of the batch
+        """
+        prefix, suffix = self._get_special_tokens()
+        width = max(len(window) for window in windows) + len(prefix) + len(suffix)
+
+        input_ids = np.full((len(windows), width), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(windows), width), dtype=np.int64)
+        for row, window in enumerate(windows):
+            start, end = len(prefix), len(prefix) + len(window)
+            input_ids[row, :start] = prefix
+            input_ids[row, start:end] = window
+            input_ids[row, end:end + len(suffix)] = suffix
+            attention_mask[row, :end + len(suffix)] = 1
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
 
-        positive = self.roberta_labels.index("positive")
-        negative = self.roberta_labels.index("negative")
-        neutral = self.roberta_labels.index("neutral")
+    def _labels_from_scores(self, scores: np.ndarray) -> List[str]:
+        """Convert a matrix of class probabilities into sentiment labels.
 
-        if scores[negative] > scores[positive] and scores[negative] > scores[neutral]:
-            return "negative"
-        elif scores[positive] > scores[negative] and scores[positive] > scores[neutral]:
-            return "positive"
-        else:
-            return "neutral"
+        A row is only labelled positive or negative when that class strictly
+        beats the other two; everything else is neutral.
+
+        :param scores: An (n, 3) array of probabilities ordered like the roBERTa labels
+        :return: A list of labels, one per row
+        """
+        positive = scores[:, self.roberta_labels.index("positive")]
+        negative = scores[:, self.roberta_labels.index("negative")]
+        neutral = scores[:, self.roberta_labels.index("neutral")]
+
+        labels = np.full(len(scores), "neutral", dtype=object)
+        labels[(negative > positive) & (negative > neutral)] = "negative"
+        labels[(positive > negative) & (positive > neutral)] = "positive"
+
+        return labels.tolist()
 
     def _calculate_vader(self, text: str) -> str:
         """Calculate the VADER sentiment score using NLTK.
@@ -87,18 +191,22 @@ class SentimentBase(ABC):
         :param text: The text to score
         :return: The highest probability class
         """
-        scores = self.vader.polarity_scores(text)
+        return self._calculate_vader_batch([text])[0]
+
+    def _calculate_vader_batch(self, texts: List[str]) -> List[str]:
+        """Calculate VADER sentiment scores for many texts at once.
+
+        :param texts: The texts to score
+        :return: The highest probability class of each text, in input order
+        """
+        if not texts:
+            return []
 
-        negative = scores["neg"]
-        positive = scores["pos"]
-        neutral = scores["neu"]
+        with collector.timer("vader_seconds", table=self.table):
+            scores = self.vader.polarity_scores_batch(texts)
+        matrix = np.array([[score[label[:3]] for label in self.roberta_labels] for score in scores])
 
-        if negative > positive and negative > neutral:
-            return "negative"
-        elif positive > negative and positive > neutral:
-            return "positive"
-        else:
-            return "neutral"
+        return self._labels_from_scores(matrix)
 
     def _calculate_roberta(self, text: str) -> str:
         """Calculate the roBERTA sentiment score using hugging-face transformers.
@@ -106,59 +214,529 @@ class SentimentBase(ABC):
         :param text: The text to score
         :return: The highest probability class
         """
-        encoded_input = self._preprocess(text)
-        return self._extract_score(encoded_input)
+        return self._calculate_roberta_batch([text])[0]
+
+    def _calculate_roberta_batch(self, texts: List[str], token_ids: Optional[List[Sequence[int]]] = None) -> List[str]:
+        """Calculate roBERTa sentiment scores for many texts at once.
+
+        :param texts: The texts to score
+        :param token_ids: The token ids of each text if they are already known, otherwise the texts are tokenized
+        :return: The highest probability class of each text, in input order
+        """
+        if token_ids is None:
+            token_ids = self._tokenize(texts)
+
+        return self._calculate_roberta_tokens(token_ids)
+
+    def _calculate_roberta_tokens(self, token_ids: List[Sequence[int]]) -> List[str]:
+        """Calculate roBERTa sentiment scores from token ids.
+
+        Every text is split into token windows, and the windows of all texts are
+        sorted by length so that each mini-batch is padded to roughly the same size.
+        The logits of a text are the mean of its windows' logits weighted by window
+        length, and the softmax is applied once over every text.
+
+        :param token_ids: The token ids of each text, without special tokens
+        :return: The highest probability class of each text, in input order
+        """
+        from scipy.special import softmax
+
+        if not token_ids:
+            return []
+
+        windows = []
+        owners = []
+        for i, ids in enumerate(token_ids):
+            for window in self._windows(ids):
+                windows.append(window)
+                owners.append(i)
+
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+        window_logits = np.empty((len(windows), len(self.roberta_labels)), dtype=np.float32)
+
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            encoded_input = self._pad([windows[i] for i in indices])
+            with collector.timer("forward_seconds", table=self.table, backend=self.backend_name):
+                window_logits[indices] = self.backend.logits(encoded_input)
+
+        owners = np.asarray(owners)
+        prefix, suffix = self._get_special_tokens()
+        weights = np.array([len(window) + len(prefix) + len(suffix) for window in windows], dtype=np.float32)
+        logits = np.zeros((len(token_ids), len(self.roberta_labels)), dtype=np.float32)
+        np.add.at(logits, owners, window_logits * weights[:, None])
+        logits /= np.bincount(owners, weights=weights, minlength=len(token_ids))[:, None]
+
+        return self._labels_from_scores(softmax(logits, axis=1))
 
-    def _retrieve_data(self, query: str) -> pd.DataFrame:
-        """Retrieves data from the database.
+    def _stream_data(
+            self,
+            query: str,
+            params: Optional[tuple] = None,
+            chunk_size: int = 256
+    ) -> Generator[List[tuple], None, None]:
+        """Stream query results from the database in fixed-size chunks.
+
+        A named cursor keeps the result set on the server, so only one chunk is held in memory at a time.
 
         :param query: The query to execute
-        :return: A DataFrame of returned results
+        :param params: The parameters of the query
+        :param chunk_size: The number of rows in each chunk
+        :return: A generator of lists of row tuples
         """
         conn = self.pool.getconn()
-        cur = conn.cursor()
-        cur.execute(query)
+        try:
+            with conn.cursor(name=f"stream_{uuid4().hex}") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, params)
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
 
-        col_names = [desc[0] for desc in cur.description]
-        results = cur.fetchall()
+    def _tokenize(self, texts: List[str]) -> List[List[int]]:
+        """Tokenize texts for the roBERTa model.
 
-        self.pool.putconn(conn)
+        :param texts: The texts to tokenize
+        :return: The token ids of each text, without special tokens
+        """
+        with collector.timer("tokenize_seconds", table=self.table):
+            return [self._preprocess(text) for text in texts]
 
-        return pd.DataFrame(results, columns=col_names)
+    def _score_texts(
+            self,
+            texts: List[str],
+            token_ids: Optional[List[Sequence[int]]] = None,
+            column: Optional[str] = None,
+            row_ids: Optional[list] = None
+    ) -> List[Tuple[str, str]]:
+        """Calculate VADER and roBERTa labels for many texts, scoring each distinct uncached text once.
+
+        :param texts: The texts to score
+        :param token_ids: The token ids of each text if they are already known
+        :param column: The name of the column the texts came from, to use its token store if one is configured
+        :param row_ids: The id of the row each text came from, needed with column
+        :return: A (vader, roberta) pair per text, in input order
+        """
+        keys = [SentimentCache.key(text) for text in texts]
+        labels = self.cache.get_many(keys) if self.cache else {}
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in labels:
+                missing.setdefault(key, i)
+
+        if missing:
+            missing_texts = [texts[i] for i in missing.values()]
+            if token_ids is not None:
+                missing_tokens = [token_ids[i] for i in missing.values()]
+            elif column is not None and self.token_store_dir is not None:
+                missing_tokens = self._store_tokens(column, texts, row_ids, keys, missing)
+            else:
+                missing_tokens = None
+            vader_scores = self._calculate_vader_batch(missing_texts)
+            roberta_scores = self._calculate_roberta_batch(missing_texts, missing_tokens)
+            scored = dict(zip(missing.keys(), zip(vader_scores, roberta_scores)))
+
+            if self.cache:
+                self.cache.put_many(scored)
+            labels.update(scored)
+
+        return [labels[key] for key in keys]
+
+    def _get_token_store(self, column: str) -> TokenStore:
+        """Get the token store of a column for the current tokenizer.
+
+        Stores are keyed by a hash of the tokenizer's vocabulary and merges rather than its path, so a
+        model loaded from another directory finds the token ids stored with the same tokenizer.
+
+        :param column: The name of the text column
+        :return: The token store, created on first use
+        """
+        if column not in self._token_stores:
+            path = os.path.join(self.token_store_dir, registry.tokenizer_id(), f"{self.table}.{column}")
+            self._token_stores[column] = TokenStore(path, vocab_size=len(self.tokenizer))
+
+        return self._token_stores[column]
 
-    def _update_row(
+    def _store_tokens(
             self,
-            row: pd.Series,
-            columns: List[str],
-            table: str
-    ) -> None:
-        """Calculate sentiment scores and add them to the database.
-
-        :param row: A row of a Pandas DataFrame
-        :param columns: The columns of text to calculate scores for
-        :param table: The name of the table to insert calculated labels
+            column: str,
+            texts: List[str],
+            row_ids: list,
+            keys: List[str],
+            missing: Dict[str, int]
+    ) -> List[Sequence[int]]:
+        """Get the token ids of uncached texts, tokenizing and storing only what the token store lacks.
+
+        Texts whose rows are stored are read from the store, the rest are tokenized once per distinct
+        text, and every row of an uncached text that is not stored yet is added to the store.
+
+        :param column: The name of the text column
+        :param texts: The texts being scored
+        :param row_ids: The id of the row each text came from
+        :param keys: The cache key of each text
+        :param missing: The position of the first text of each uncached key
+        :return: The token ids of each uncached key, in the order of missing
+        """
+        store = self._get_token_store(column)
+        positions = [i for i, key in enumerate(keys) if key in missing]
+        stored = dict(zip(positions, store.contains([row_ids[i] for i in positions])))
+
+        token_ids = {}
+        for key, i in missing.items():
+            # Rows stored since the store was loaded are not readable yet and are tokenized again
+            view = store.get(row_ids[i]) if stored[i] else None
+            if view is not None:
+                token_ids[key] = view
+        untokenized = [key for key in missing if key not in token_ids]
+        token_ids.update(zip(untokenized, self._tokenize([texts[missing[key]] for key in untokenized])))
+
+        new_rows = [i for i in positions if not stored[i]]
+        store.put_many([row_ids[i] for i in new_rows], [token_ids[keys[i]] for i in new_rows])
+
+        return [token_ids[key] for key in missing]
+
+    def _score_texts_individually(self, texts: List[str], row_ids: list) -> List[Tuple[str, str]]:
+        """Score texts one at a time so that a text which cannot be scored only skips its own row.
+
+        :param texts: The texts to score
+        :param row_ids: The id of the row each text came from, used when reporting failures
+        :return: A (vader, roberta) pair per text, or (None, None) for texts that failed
+        """
+        text_scores = []
+        for row_id, text in zip(row_ids, texts):
+            try:
+                text_scores.extend(self._score_texts([text]))
+            except Exception:
+                logging.exception(f"Could not score {self.table} row {row_id}")
+                text_scores.append((None, None))
+        return text_scores
+
+    def _update_rows(self, rows: List[tuple]) -> None:
+        """Calculate sentiment scores for a chunk of rows and buffer them for writing to the database.
+
+        When a chunk fails its texts are retried one by one, and rows that still
+        fail are counted as skipped and left unscored for the next run.
+
+        :param rows: A chunk of (id, *text columns) tuples
         :return: None
         """
-        for column in columns:
+        scores = []
+        scored = skipped = 0
+        for position, column in enumerate(self.columns, start=1):
+            texts = [row[position] for row in rows]
+            indices = [i for i, text in enumerate(texts) if isinstance(text, str)]
+            column_scores = [(None, None)] * len(texts)
             try:
-                vader_score = self._calculate_vader(row[column])
-                roberta_score = self._calculate_roberta(row[column])
-            except:
-                logging.info(f"Could not process {row['id']}")
-                continue
-
-            query = f"""
-                    UPDATE {table}
-                    SET 
-                        vader_score_{column} = %s,
-                        roberta_score_{column} = %s
-                    WHERE id = %s
-                    """
-            conn = self.pool.getconn()
-            cur = conn.cursor()
-            cur.execute(query, (vader_score, roberta_score, row["id"]))
-            conn.commit()
-            self.pool.putconn(conn)
+                text_scores = self._score_texts(
+                    [texts[i] for i in indices],
+                    column=column,
+                    row_ids=[rows[i][0] for i in indices]
+                )
+            except Exception:
+                logging.warning(f"Could not process chunk starting at {rows[0][0]}, retrying row by row")
+                text_scores = self._score_texts_individually(
+                    [texts[i] for i in indices],
+                    [rows[i][0] for i in indices]
+                )
+            for i, labels in zip(indices, text_scores):
+                column_scores[i] = labels
+                if labels[0] is None:
+                    skipped += 1
+                else:
+                    scored += 1
+            scores.append(column_scores)
+
+        for i, row in enumerate(rows):
+            self.sink.add(row[0], [column_scores[i] for column_scores in scores])
+
+        with self._counter_lock:
+            self.scored += scored
+            self.skipped += skipped
+
+        collector.inc("rows_done", len(rows), stage=self.table)
+        collector.inc("texts_scored", scored, table=self.table)
+        collector.inc("texts_skipped", skipped, table=self.table)
+
+    def _score_chunks(self, chunks: Iterable[List[tuple]], max_pending: int = 4) -> None:
+        """Score chunks of rows on a thread pool and write the results to the database.
+
+        At most max_pending chunks are queued at once, so reading never runs far ahead of scoring.
+        An error scoring or writing a chunk is raised here, so callers never checkpoint past rows that
+        were not written.
+
+        :param chunks: An iterable of chunks of (id, *text columns) tuples
+        :param max_pending: The maximum number of chunks waiting to be scored
+        :return: None
+        """
+        with ThreadPoolExecutor() as executor:
+            pending = set()
+            for chunk in chunks:
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                if collector.sample(f"score:{self.table}"):
+                    logging.debug(f"Processing {len(chunk)} rows of {self.table} from {chunk[0][0]}")
+                pending.add(executor.submit(self._update_rows, chunk))
+
+            for future in wait(pending).done:
+                future.result()
+
+        self.sink.flush()
+
+        logging.info(f"Scored {self.scored} texts of {self.table}, skipped {self.skipped}")
+        if self.skipped:
+            logging.warning(f"{self.skipped} texts of {self.table} could not be scored and were left for the next run")
+
+        if self.cache:
+            collector.set_gauge("cache_hit_rate", self.cache.hit_rate(), table=self.table)
+            logging.info(
+                f"Sentiment cache: {self.cache.hits} hits, {self.cache.misses} misses "
+                f"({self.cache.hit_rate():.1%} hit rate)"
+            )
+
+    @property
+    def where(self) -> str:
+        """Get the condition matching rows with a text column that is unscored or failed to score.
+
+        This matches the predicate of the partial indexes in db/, so the planner can use them.
+        """
+        return " OR ".join(
+            f"({column} IS NOT NULL AND (vader_score_{column} IS NULL OR roberta_score_{column} IS NULL))"
+            for column in self.columns
+        )
+
+    def _load_checkpoint(self) -> Optional[str]:
+        """Get the last id committed by an interrupted scoring run.
+
+        :return: The last committed id, or None to start from the beginning
+        """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SELECT last_id FROM sentiment_checkpoints WHERE table_name = %s", (self.table,))
+        result = cur.fetchone()
+        conn.commit()
+        self.pool.putconn(conn)
+
+        return result[0] if result else None
+
+    def _save_checkpoint(self, last_id: Optional[str]) -> None:
+        """Record the last id whose scores have been committed.
+
+        :param last_id: The last committed id, or None once a run is complete
+        :return: None
+        """
+        query = """
+                INSERT INTO sentiment_checkpoints
+                    (table_name, last_id, updated_at)
+                VALUES
+                    (%s, %s, NOW())
+                ON CONFLICT (table_name) DO UPDATE
+                SET
+                    last_id = EXCLUDED.last_id,
+                    updated_at = EXCLUDED.updated_at
+                """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(query, (self.table, last_id))
+        conn.commit()
+        self.pool.putconn(conn)
+
+    def _count_pending(self, last_id: Optional[str]) -> int:
+        """Count the rows left to score after a checkpoint.
+
+        :param last_id: The last id scored, or None to count from the start of the table
+        :return: The number of rows
+        """
+        query = f"""
+                SELECT COUNT(*)
+                FROM {self.table}
+                WHERE (%s IS NULL OR id > %s)
+                AND ({self.where})
+                """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(query, (last_id, last_id))
+        count = cur.fetchone()[0]
+        conn.commit()
+        self.pool.putconn(conn)
+
+        return count
+
+    def _score_pending(self, chunk_size: int, page_size: int) -> None:
+        """Score rows that are new or failed, one keyset page at a time.
+
+        The checkpoint is advanced after each page is written, so an interrupted run resumes where it stopped.
+        It is cleared once the end of the table is reached so the next run picks up failed rows again.
+
+        :param chunk_size: The number of rows scored together
+        :param page_size: The number of rows read per page
+        :return: None
+        """
+        query = f"""
+                SELECT id, {", ".join(self.columns)}
+                FROM {self.table}
+                WHERE (%s IS NULL OR id > %s)
+                AND ({self.where})
+                ORDER BY id
+                LIMIT %s
+                """
+        last_id = self._load_checkpoint()
+        if last_id is not None:
+            logging.info(f"Resuming {self.table} after {last_id}")
+        collector.set_total(self.table, self._count_pending(last_id))
+
+        while True:
+            chunks = list(self._stream_data(query, (last_id, last_id, page_size), chunk_size))
+            if not chunks:
+                break
+
+            self._score_chunks(chunks)
+            last_id = chunks[-1][-1][0]
+            self._save_checkpoint(last_id)
+
+            if sum(len(chunk) for chunk in chunks) < page_size:
+                break
+
+        self._save_checkpoint(None)
+
+    def _worker_kwargs(self) -> dict:
+        """Get the keyword arguments used to rebuild this scorer in a worker process."""
+        return {
+            "batch_size": self.batch_size,
+            "flush_size": self.sink.flush_size,
+            "flush_interval": self.sink.flush_interval,
+            "cache_size": self.cache.max_size if self.cache else None,
+            "backend": self.backend_name,
+            "max_length": self.max_length,
+            "window_overlap": self.window_overlap,
+            "token_store_dir": self.token_store_dir
+        }
+
+    def _get_id_ranges(self, range_size: int) -> List[Tuple[str, Optional[str]]]:
+        """Split the rows still needing scores into id ranges of roughly equal size.
+
+        :param range_size: The number of rows in each range
+        :return: A list of (start id, end id) pairs, the end being exclusive and None for the last range
+        """
+        query = f"""
+                SELECT id
+                FROM (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS row_num
+                    FROM {self.table}
+                    WHERE {self.where}
+                ) AS numbered
+                WHERE (row_num - 1) %% %s = 0
+                ORDER BY id
+                """
+        boundaries = [row[0] for chunk in self._stream_data(query, (range_size,)) for row in chunk]
+
+        return list(zip(boundaries, boundaries[1:] + [None]))
+
+    def _score_range(self, start_id: str, end_id: Optional[str], chunk_size: int) -> None:
+        """Score every row needing scores within an id range.
+
+        :param start_id: The first id of the range
+        :param end_id: The id ending the range (exclusive), or None for no upper bound
+        :param chunk_size: The number of rows scored together
+        :return: None
+        """
+        query = f"""
+                SELECT id, {", ".join(self.columns)}
+                FROM {self.table}
+                WHERE ({self.where})
+                AND id >= %s
+                AND (%s IS NULL OR id < %s)
+                ORDER BY id
+                """
+        for chunk in self._stream_data(query, (start_id, end_id, end_id), chunk_size):
+            self._update_rows(chunk)
+
+    def _find_untokenized(self, column: str, store: TokenStore, chunk_size: int) -> Generator[List[str], None, None]:
+        """Find the rows with text in a column whose token ids are not in the token store.
+
+        Only ids are streamed, so this is cheap compared to reading and tokenizing the texts.
+
+        :param column: The name of the text column
+        :param store: The loaded token store of the column
+        :param chunk_size: The number of ids read at a time
+        :return: A generator of lists of the ids missing from the store
+        """
+        query = f"SELECT id FROM {self.table} WHERE {column} IS NOT NULL"
+        for chunk in self._stream_data(query, chunk_size=chunk_size):
+            row_ids = [row[0] for row in chunk]
+            missing = [row_id for row_id, stored in zip(row_ids, store.contains(row_ids)) if not stored]
+            if missing:
+                yield missing
+
+    def _retrieve_texts(self, column: str, row_ids: List[str]) -> List[Tuple[str, str]]:
+        """Read the texts of a column for some rows.
+
+        :param column: The name of the text column
+        :param row_ids: The ids of the rows
+        :return: A list of (id, text) pairs
+        """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, {column} FROM {self.table} WHERE id = ANY(%s) AND {column} IS NOT NULL", (row_ids,))
+        rows = cur.fetchall()
+        conn.commit()
+        self.pool.putconn(conn)
+
+        return rows
+
+    def _rescore_tokens(self, position: int, row_ids: List[str], token_ids: List[Sequence[int]]) -> None:
+        """Calculate the roBERTa labels of one column from token ids and buffer them for writing.
+
+        :param position: The position of the column in self.columns
+        :param row_ids: The id of each row
+        :param token_ids: The token ids of each row's text
+        :return: None
+        """
+        labels = self._calculate_roberta_tokens(token_ids)
+        for row_id, label in zip(row_ids, labels):
+            scores = [(None, None)] * len(self.columns)
+            scores[position] = (None, label)
+            self.sink.add(row_id, scores)
+        collector.inc("rows_done", len(row_ids), stage=f"rescore_{self.table}")
+
+    def rescore(self, chunk_size: int = 256) -> None:
+        """Recalculate the roBERTa labels of every row from the token store without reading or tokenizing text.
+
+        Rows are batched by token count, and VADER labels are left untouched. Use this after switching
+        to another model that shares the tokenizer the token ids were stored with. Rows missing from the
+        store, or every row when the store is empty, are read and tokenized instead, and their token ids
+        are stored for the next rescore.
+
+        :param chunk_size: The number of rows scored together
+        :return: None
+        """
+        if self.token_store_dir is None:
+            raise ValueError("Rescoring needs a token store directory")
+
+        for position, column in enumerate(self.columns):
+            store = self._get_token_store(column)
+            store.load()
+            logging.info(f"Rescoring {len(store)} rows of {self.table}.{column} from stored tokens")
+
+            for row_ids, token_ids in store.iter_batches(chunk_size):
+                self._rescore_tokens(position, row_ids, token_ids)
+
+            missing = 0
+            for row_ids in self._find_untokenized(column, store, chunk_size):
+                rows = self._retrieve_texts(column, row_ids)
+                token_ids = self._tokenize([row[1] for row in rows])
+                store.put_many([row[0] for row in rows], token_ids)
+                self._rescore_tokens(position, [row[0] for row in rows], token_ids)
+                missing += len(rows)
+            if missing:
+                logging.warning(f"Tokenized {missing} rows of {self.table}.{column} that had no stored tokens")
+
+            # Each column is flushed separately so a row is never updated twice in one statement
+            self.sink.flush()
 
     @abstractmethod
     def apply_sentiment(self):
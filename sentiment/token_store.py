@@ -0,0 +1,183 @@
+"""Persists the token ids of scored texts so that later runs can rescore without reading or tokenizing text.
+
+A store holds the texts of one column tokenized by one tokenizer. Token ids are appended to flat
+binary part files, one per writing process, and each write adds a small index segment mapping
+row ids to an offset and length in a part. Reading memory-maps the parts, so the token ids of a
+row are a view into the file rather than a copy. Reads see the store as it was when it was last
+loaded; contains also sees the rows written since.
+"""
+from glob import glob
+import json
+import os
+from threading import Lock
+from typing import Generator, List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+
+class TokenStore:
+    """An append-only store of token id arrays keyed by row id."""
+
+    def __init__(self, path: str, vocab_size: Optional[int] = None):
+        """Initialize a TokenStore, creating its directory if it does not exist.
+
+        :param path: The directory of the store
+        :param vocab_size: The size of the tokenizer's vocabulary, used to pick the smallest id type for a new store
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                self.dtype = np.dtype(json.load(meta_file)["dtype"])
+        else:
+            self.dtype = np.dtype(np.uint16 if vocab_size is not None and vocab_size <= 2 ** 16 else np.int32)
+            with open(meta_path, "w") as meta_file:
+                json.dump({"dtype": self.dtype.str}, meta_file)
+
+        self._part = None
+        self._part_size = 0
+        self._segments = 0
+        self._lock = Lock()
+
+        self.row_ids: Optional[np.ndarray] = None
+        self.parts: List[np.memmap] = []
+        self._entries: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._written: Set[str] = set()
+
+    def put_many(self, row_ids: Sequence[str], token_ids: Sequence[Sequence[int]]) -> None:
+        """Append the token ids of many rows.
+
+        The rows are seen by contains straight away, and by get and iter_batches once the store is
+        loaded again. A row written again is replaced the next time the store is loaded.
+
+        :param row_ids: The ids of the rows
+        :param token_ids: The token ids of each row, without special tokens
+        :return: None
+        """
+        if not row_ids:
+            return
+
+        lengths = np.fromiter((len(ids) for ids in token_ids), dtype=np.int32, count=len(token_ids))
+        tokens = np.concatenate([np.asarray(ids, dtype=self.dtype) for ids in token_ids])
+
+        with self._lock:
+            if self._part is None:
+                self._part = uuid4().hex
+
+            offsets = self._part_size + np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+            with open(os.path.join(self.path, f"{self._part}.bin"), "ab") as part_file:
+                part_file.write(tokens.tobytes())
+            self._part_size += len(tokens)
+
+            # The index is written after the tokens it points to, and renamed into place whole
+            segment_path = os.path.join(self.path, f"{self._part}-{self._segments:06d}.npz")
+            temporary_path = f"{segment_path}.tmp.npz"
+            np.savez(temporary_path, row_ids=np.asarray(row_ids, dtype=str), offsets=offsets, lengths=lengths)
+            os.replace(temporary_path, segment_path)
+            self._segments += 1
+            self._written.update(row_ids)
+
+    def load(self) -> None:
+        """Read every index segment and memory-map the part files.
+
+        :return: None
+        """
+        with self._lock:
+            self._written = set()
+
+        row_ids, parts, offsets, lengths = [], [], [], []
+        part_names = []
+        segments = sorted(glob(os.path.join(self.path, "*-*.npz")), key=lambda path: (os.path.getmtime(path), path))
+        for segment_path in segments:
+            if segment_path.endswith(".tmp.npz"):
+                continue
+            part_name = os.path.basename(segment_path).rsplit("-", 1)[0]
+            if part_name not in part_names:
+                part_names.append(part_name)
+
+            with np.load(segment_path) as segment:
+                row_ids.append(segment["row_ids"])
+                offsets.append(segment["offsets"])
+                lengths.append(segment["lengths"])
+            parts.append(np.full(len(row_ids[-1]), part_names.index(part_name), dtype=np.int32))
+
+        self.parts = [
+            np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=self.dtype, mode="r")
+            if os.path.getsize(os.path.join(self.path, f"{name}.bin")) else np.empty(0, dtype=self.dtype)
+            for name in part_names
+        ]
+        if not row_ids:
+            self.row_ids = np.empty(0, dtype=str)
+            self._entries = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+            return
+
+        # Keep the last write of each row, ordered by row id for lookups
+        all_ids = np.concatenate(row_ids)[::-1]
+        self.row_ids, first = np.unique(all_ids, return_index=True)
+        self._entries = tuple(np.concatenate(values)[::-1][first] for values in (parts, offsets, lengths))
+
+    def _ensure_loaded(self) -> None:
+        if self.row_ids is None:
+            self.load()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self.row_ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Get the number of tokens of every row, in the order of row_ids."""
+        self._ensure_loaded()
+        return self._entries[2]
+
+    def _view(self, index: int) -> np.ndarray:
+        """Get the token ids at a position of the index without copying them.
+
+        :param index: The position in row_ids
+        :return: A view into a memory-mapped part
+        """
+        part, offset, length = (values[index] for values in self._entries)
+        return self.parts[part][offset:offset + length]
+
+    def contains(self, row_ids: Sequence[str]) -> np.ndarray:
+        """Check which rows are stored, including rows written since the store was loaded.
+
+        :param row_ids: The ids of the rows
+        :return: A boolean array, True for each row that is stored
+        """
+        self._ensure_loaded()
+        row_ids = np.asarray(row_ids, dtype=str)
+        indices = np.minimum(np.searchsorted(self.row_ids, row_ids), max(len(self.row_ids) - 1, 0))
+        loaded = self.row_ids[indices] == row_ids if len(self.row_ids) else np.zeros(len(row_ids), dtype=bool)
+        with self._lock:
+            written = np.fromiter((row_id in self._written for row_id in row_ids), dtype=bool, count=len(row_ids))
+
+        return loaded | written
+
+    def get(self, row_id: str) -> Optional[np.ndarray]:
+        """Get the token ids of a row.
+
+        :param row_id: The id of the row
+        :return: A view of the token ids, or None if the row was not stored when the store was loaded
+        """
+        self._ensure_loaded()
+        index = np.searchsorted(self.row_ids, row_id)
+        if index == len(self.row_ids) or self.row_ids[index] != row_id:
+            return None
+
+        return self._view(index)
+
+    def iter_batches(self, batch_size: int) -> Generator[Tuple[List[str], List[np.ndarray]], None, None]:
+        """Iterate over every stored row in batches of similar length.
+
+        :param batch_size: The number of rows per batch
+        :return: A generator of (row ids, token id views) pairs
+        """
+        self._ensure_loaded()
+        order = np.argsort(self.lengths, kind="stable")
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            yield self.row_ids[indices].tolist(), [self._view(index) for index in indices]
@@ -0,0 +1,102 @@
+"""A faster drop-in for NLTK's VADER SentimentIntensityAnalyzer when scoring many texts.
+
+NLTK's SentiText builds a dictionary of every word joined with every punctuation mark for each
+text, and polarity_scores looks each word's position up with list.index. This module finds the
+same words directly and indexes positions once, producing identical scores.
+"""
+import string
+from typing import Dict, List
+
+from nltk.sentiment.vader import SentimentIntensityAnalyzer, SentiText
+
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+PUNCTUATION = set(string.punctuation)
+
+
+class FastSentiText(SentiText):
+    """A SentiText that strips punctuation around words without building a lookup table."""
+
+    def _words_and_emoticons(self) -> List[str]:
+        """Remove leading and trailing punctuation from each word, as SentiText does.
+
+        :return: The words and emoticons of the text
+        """
+        words_only = {word for word in self.text.translate(PUNCTUATION_TABLE).split() if len(word) > 1}
+
+        words = []
+        for token in self.text.split():
+            if len(token) <= 1:
+                continue
+            words.append(self._strip_punctuation(token, words_only))
+
+        return words
+
+    def _strip_punctuation(self, token: str, words_only: set) -> str:
+        """Strip one punctuation mark from the end or start of a token if that leaves a known word.
+
+        :param token: A whitespace-separated token
+        :param words_only: The words of the text with all punctuation removed
+        :return: The stripped word, or the token unchanged
+        """
+        if token[0] not in PUNCTUATION and token[-1] not in PUNCTUATION:
+            return token
+
+        for punctuation in self.PUNC_LIST:
+            if token.endswith(punctuation) and token[:-len(punctuation)] in words_only:
+                return token[:-len(punctuation)]
+        for punctuation in self.PUNC_LIST:
+            if token.startswith(punctuation) and token[len(punctuation):] in words_only:
+                return token[len(punctuation):]
+
+        return token
+
+
+class BatchSentimentIntensityAnalyzer(SentimentIntensityAnalyzer):
+    """Scores many texts with VADER, reusing tokenization and skipping words without valence."""
+
+    def polarity_scores(self, text: str) -> Dict[str, float]:
+        """Return the VADER scores of a text, identical to SentimentIntensityAnalyzer.polarity_scores.
+
+        :param text: The text to score
+        :return: A dict of neg, neu, pos and compound scores
+        """
+        sentitext = FastSentiText(
+            text, self.constants.PUNC_LIST, self.constants.REGEX_REMOVE_PUNCTUATION
+        )
+        words_and_emoticons = sentitext.words_and_emoticons
+
+        # polarity_scores positions repeated words at their first occurrence
+        first_index = {}
+        for i, item in enumerate(words_and_emoticons):
+            first_index.setdefault(item, i)
+
+        sentiments = []
+        for item in words_and_emoticons:
+            item_lowercase = item.lower()
+            i = first_index[item]
+            if (
+                i < len(words_and_emoticons) - 1
+                and item_lowercase == "kind"
+                and words_and_emoticons[i + 1].lower() == "of"
+            ) or item_lowercase in self.constants.BOOSTER_DICT or item_lowercase not in self.lexicon:
+                sentiments.append(0)
+                continue
+
+            sentiments = self.sentiment_valence(0, sentitext, item, i, sentiments)
+
+        sentiments = self._but_check(words_and_emoticons, sentiments)
+
+        return self.score_valence(sentiments, text)
+
+    def polarity_scores_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """Return the VADER scores of many texts, scoring each distinct text once.
+
+        :param texts: The texts to score
+        :return: A dict of neg, neu, pos and compound scores per text, in input order
+        """
+        scores = {}
+        for text in texts:
+            if text not in scores:
+                scores[text] = self.polarity_scores(text)
+
+        return [scores[text] for text in texts]
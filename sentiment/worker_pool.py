@@ -0,0 +1,125 @@
+"""Scores sentiment in separate processes so VADER and roBERTa are not bound by a single GIL.
+
+Each worker process loads its own tokenizer, model and VADER analyzer once, opens its own
+Postgres connection and then pulls id ranges off a shared queue until it receives a sentinel.
+"""
+import logging
+import multiprocessing
+import os
+from queue import Empty
+from typing import List, Optional, Tuple, Type
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from sentiment import registry
+
+
+def _worker(
+        adder_cls: Type,
+        work_queue: multiprocessing.Queue,
+        done_queue: multiprocessing.Queue,
+        threads: int,
+        chunk_size: int,
+        adder_kwargs: dict
+) -> None:
+    """Score id ranges from a queue until a None sentinel is received.
+
+    :param adder_cls: The SentimentBase subclass used to score rows
+    :param work_queue: A queue of (start id, end id) ranges
+    :param done_queue: A queue the ranges are reported on once their labels are written
+    :param threads: The number of torch intra-op threads for this worker
+    :param chunk_size: The number of rows scored together
+    :param adder_kwargs: Keyword arguments passed to the adder's constructor
+    :return: None
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+
+    pool = ThreadedConnectionPool(
+        minconn=1,
+        maxconn=2,
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        database=os.getenv("PG_DATABASE")
+    )
+    adder = adder_cls(pool, **adder_kwargs)
+
+    done = []
+    while (work := work_queue.get()) is not None:
+        start_id, end_id = work
+        logging.info(f"Worker {os.getpid()} processing {adder.table} from {start_id} to {end_id}")
+        adder._score_range(start_id, end_id, chunk_size)
+        done.append(work)
+
+    # Labels are buffered, so ranges only count as done once they have been flushed
+    adder.sink.flush()
+    done_queue.put(done)
+    pool.closeall()
+
+
+def run_workers(
+        adder_cls: Type,
+        id_ranges: List[Tuple[str, Optional[str]]],
+        workers: int,
+        chunk_size: int = 256,
+        adder_kwargs: Optional[dict] = None
+) -> None:
+    """Score id ranges across a pool of worker processes.
+
+    Workers connect to Postgres with the PG_USER, PG_PASSWORD and PG_DATABASE environment variables.
+    A worker that exits with an error leaves the ranges it was given unscored, which raises a RuntimeError
+    once every worker has stopped.
+
+    :param adder_cls: The SentimentBase subclass used to score rows
+    :param id_ranges: A list of (start id, end id) ranges to score
+    :param workers: The number of worker processes
+    :param chunk_size: The number of rows scored together
+    :param adder_kwargs: Keyword arguments passed to the adder's constructor in each worker
+    :return: None
+    """
+    # Export the model once here rather than in every worker at the same time
+    registry.prepare_backend((adder_kwargs or {}).get("backend", "torch"))
+
+    context = multiprocessing.get_context("spawn")
+    work_queue = context.Queue()
+    done_queue = context.Queue()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    for id_range in id_ranges:
+        work_queue.put(id_range)
+    for _ in range(workers):
+        work_queue.put(None)
+
+    processes = [
+        context.Process(
+            target=_worker,
+            args=(adder_cls, work_queue, done_queue, threads, chunk_size, adder_kwargs or {})
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Drain the done queue while workers run, so none of them blocks on exit writing to it
+    done = []
+    while any(process.is_alive() for process in processes):
+        try:
+            done.extend(done_queue.get(timeout=1))
+        except Empty:
+            pass
+    for process in processes:
+        process.join()
+    while True:
+        try:
+            done.extend(done_queue.get_nowait())
+        except Empty:
+            break
+
+    exit_codes = [process.exitcode for process in processes if process.exitcode != 0]
+    if exit_codes:
+        failed = [id_range for id_range in id_ranges if tuple(id_range) not in {tuple(work) for work in done}]
+        raise RuntimeError(
+            f"{len(exit_codes)} of {workers} workers exited with codes {exit_codes}, "
+            f"leaving {len(failed)} id ranges unscored: {failed}"
+        )
@@ -0,0 +1,181 @@
+import logging
+import re
+from typing import Dict, List, Optional, Pattern, Set
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import collector
+from sentiment.daily_aggregate import refresh_daily_sentiment
+
+# Tickers that are also common words or WSB slang; these are only matched as cashtags like $IT
+STOP_WORDS = {
+    "A", "ALL", "AM", "AN", "ANY", "ARE", "AT", "BE", "BIG", "BY", "CAN", "CEO", "DD", "EOD", "EV", "FOR",
+    "FUN", "GO", "GOOD", "HAS", "HE", "HOLD", "I", "IMO", "IN", "IS", "IT", "LOVE", "MOON", "NEW", "NOW",
+    "ON", "ONE", "OR", "OUT", "PM", "REAL", "SO", "TV", "UK", "UP", "US", "USA", "WSB", "YOLO"
+}
+
+# Corporate suffixes dropped from company names before matching
+NAME_SUFFIXES = re.compile(
+    r"[,.]?\s+(inc|corp|corporation|co|company|ltd|limited|plc|holdings|group|class [a-z])\.?$",
+    re.IGNORECASE
+)
+
+
+class SymbolTagger:
+    """Tags posts and comments with the stock symbols they mention.
+
+    Cashtags ($GME), bare upper-case tickers (GME) and company names (GameStop) from the stocks
+    table are all matched by a single compiled regular expression.
+    """
+
+    def __init__(
+            self,
+            pool: ThreadedConnectionPool,
+            stop_words: Optional[Set[str]] = None,
+            chunk_size: int = 5000
+    ):
+        """Initialize a SymbolTagger.
+
+        :param pool: An initialized thread-safe Postgres connection pool
+        :param stop_words: Tickers only matched as cashtags, defaulting to STOP_WORDS
+        :param chunk_size: The number of rows tagged per transaction
+        """
+        self.pool = pool
+        self.stop_words = stop_words if stop_words is not None else STOP_WORDS
+        self.chunk_size = chunk_size
+
+        self.symbols: Set[str] = set()
+        self.names: Dict[str, str] = {}
+        self.pattern: Optional[Pattern] = None
+
+    @staticmethod
+    def _clean_name(name: str) -> str:
+        """Remove corporate suffixes from a company name.
+
+        :param name: The company name from the stocks table
+        :return: The name as it is likely to appear in a post
+        """
+        previous = None
+        while previous != name:
+            previous = name
+            name = NAME_SUFFIXES.sub("", name).strip()
+
+        return name
+
+    def _load_stocks(self) -> None:
+        """Load the stocks table and compile the matching expression.
+
+        :return: None
+        """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SELECT symbol, name FROM stocks")
+        stocks = cur.fetchall()
+        conn.commit()
+        self.pool.putconn(conn)
+
+        self.symbols = {symbol.upper() for symbol, _ in stocks}
+        self.names = {
+            self._clean_name(name).lower(): symbol.upper()
+            for symbol, name in stocks
+            if name and len(self._clean_name(name)) > 2
+        }
+
+        tickers = sorted(self.symbols - self.stop_words, key=len, reverse=True)
+        names = sorted(self.names, key=len, reverse=True)
+
+        alternatives = [r"\$(?P<cashtag>[A-Za-z]{1,5})\b"]
+        if tickers:
+            alternatives.append(r"\b(?P<ticker>" + "|".join(map(re.escape, tickers)) + r")\b")
+        if names:
+            alternatives.append(r"(?i:\b(?P<name>" + "|".join(map(re.escape, names)) + r")\b)")
+
+        self.pattern = re.compile("|".join(alternatives))
+
+    def find_symbols(self, text: Optional[str]) -> Set[str]:
+        """Find the stock symbols mentioned in a text.
+
+        :param text: The text to search
+        :return: A set of symbols from the stocks table
+        """
+        if self.pattern is None:
+            self._load_stocks()
+        if not text:
+            return set()
+
+        found = set()
+        for match in self.pattern.finditer(text):
+            if match.group("cashtag"):
+                symbol = match.group("cashtag").upper()
+                if symbol in self.symbols:
+                    found.add(symbol)
+            elif match.lastgroup == "ticker":
+                found.add(match.group("ticker"))
+            else:
+                found.add(self.names[match.group("name").lower()])
+
+        return found
+
+    def _tag_table(self, table: str, xref_table: str, columns: List[str]) -> None:
+        """Tag every row of a table that has not been tagged yet.
+
+        Rows are found through the tagged flag rather than an id checkpoint, because they are not
+        inserted in id order. Each chunk's xref rows and flags are committed together, so an
+        interrupted run neither loses nor duplicates tags.
+
+        :param table: The name of the table holding the texts
+        :param xref_table: The name of the xref table to fill
+        :param columns: The text columns to search
+        :return: None
+        """
+        select_query = f"""
+                       SELECT id, {", ".join(columns)}
+                       FROM {table}
+                       WHERE NOT tagged
+                       ORDER BY id
+                       LIMIT %s
+                       """
+        insert_query = f"INSERT INTO {xref_table} (id, symbol) VALUES %s ON CONFLICT DO NOTHING"
+        update_query = f"UPDATE {table} SET tagged = TRUE WHERE id = ANY(%s)"
+
+        tagged = 0
+
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        while True:
+            cur.execute(select_query, (self.chunk_size,))
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            xrefs = [
+                (row[0], symbol)
+                for row in rows
+                for symbol in self.find_symbols(" ".join(text for text in row[1:] if text))
+            ]
+            if xrefs:
+                execute_values(cur, insert_query, xrefs, page_size=len(xrefs))
+
+            cur.execute(update_query, ([row[0] for row in rows],))
+            conn.commit()
+
+            tagged += len(rows)
+            collector.inc("rows_done", len(rows), stage=f"tag_{table}")
+            collector.inc("symbol_mentions", len(xrefs), table=table)
+            logging.info(f"Tagged {tagged} rows of {table} with {len(xrefs)} new symbol mentions")
+
+        conn.commit()
+        self.pool.putconn(conn)
+
+    def tag_all(self) -> None:
+        """Tag new posts and comments with the stock symbols they mention.
+
+        The daily sentiment of the dates of newly tagged posts is refreshed afterwards.
+
+        :return: None
+        """
+        self._tag_table("posts", "posts_stocks_xref", ["title", "post_text"])
+        self._tag_table("comments", "comments_stocks_xref", ["body"])
+
+        refresh_daily_sentiment(self.pool)
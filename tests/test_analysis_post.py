@@ -0,0 +1,90 @@
+"""Check that posts loaded by analysis.post.get_data can be merged with stocks per symbol.
+
+Posts are read from a snapshot written to a temporary directory, or from a fake Postgres connection.
+"""
+from datetime import datetime
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pa = pytest.importorskip("pyarrow")
+pytest.importorskip("psycopg2")
+
+import pyarrow.dataset as ds
+
+from analysis import post, snapshot
+from analysis.utils import merge_stocks_and_posts
+
+# (id, author, created_at, vader title, roberta title, vader post_text, roberta post_text, symbol)
+ROWS = [
+    ("a1", "ape", datetime(2021, 1, 29, 15), "positive", "positive", None, None, "GME"),
+    ("a1", "ape", datetime(2021, 1, 29, 15), "positive", "positive", None, None, "AMC"),
+    ("b2", "bear", datetime(2021, 1, 30, 12), "negative", "neutral", "negative", "negative", "GME"),
+    ("c3", "bull", datetime(2021, 2, 1, 9), "neutral", None, None, None, "AMC")
+]
+
+# GME traded on Monday February 1st, while AMC's next session is a day later
+STOCKS = pd.DataFrame({
+    "Date": pd.to_datetime(["2021-01-29", "2021-02-01", "2021-01-29", "2021-02-02"]),
+    "symbol": ["GME", "GME", "AMC", "AMC"],
+    "Close": [325.0, 225.0, 13.26, 8.0]
+})
+
+
+class FakeCursor:
+    description = [(name,) for name in ["id", "author", "created_at"] + post.SCORE_COLUMNS + ["symbol"]]
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params):
+        symbols = params[0]
+        self.rows = [row for row in self.rows if row[-1] in symbols]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor(ROWS)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def snapshot_posts(tmp_path, monkeypatch):
+    columns = list(zip(*ROWS))
+    table = pa.table({
+        "id": pa.array(columns[0], pa.string()),
+        "author": pa.array(columns[1], pa.string()),
+        "created_at": pa.array(columns[2], pa.timestamp("us")),
+        **{name: pa.array(values, pa.string()) for name, values in zip(post.SCORE_COLUMNS, columns[3:7])},
+        "created_date": pa.array([created_at.date() for created_at in columns[2]], pa.date32()),
+        "symbol": pa.array(columns[7], pa.string())
+    }, schema=snapshot.POSTS_SCHEMA)
+    ds.write_dataset(table, tmp_path / "posts", format="parquet", partitioning=snapshot.PARTITIONING)
+
+    monkeypatch.setattr(snapshot, "is_fresh", lambda **kwargs: True)
+    read_posts = snapshot.read_posts
+    monkeypatch.setattr(snapshot, "read_posts", lambda symbols, columns: read_posts(symbols, columns, str(tmp_path)))
+
+
+@pytest.fixture
+def postgres_posts(monkeypatch):
+    monkeypatch.setattr(post, "pg_conn", FakeConnection)
+
+
+@pytest.mark.parametrize("source", ["snapshot_posts", "postgres_posts"])
+def test_get_data_merges_by_symbol(request, source):
+    request.getfixturevalue(source)
+
+    posts = post.get_data(["GME", "AMC"])
+    assert sorted(zip(posts["id"], posts["symbol"])) == [("a1", "AMC"), ("a1", "GME"), ("b2", "GME"), ("c3", "AMC")]
+
+    merged = merge_stocks_and_posts(STOCKS, posts, by="symbol")
+    closes = {(row.id, row.symbol): row.Close for row in merged.itertuples()}
+
+    # Saturday's post is matched to the next session of its own symbol
+    assert closes == {("a1", "GME"): 325.0, ("a1", "AMC"): 13.26, ("b2", "GME"): 225.0, ("c3", "AMC"): 8.0}
@@ -0,0 +1,65 @@
+"""Check the shared model registry without loading any model."""
+import json
+from threading import Thread
+
+import pytest
+
+from sentiment import registry
+
+
+class FakeBackendTokenizer:
+    def __init__(self, vocab: dict):
+        self.vocab = vocab
+
+    def to_str(self) -> str:
+        return json.dumps({
+            "truncation": None,
+            "padding": None,
+            "added_tokens": [],
+            "normalizer": None,
+            "pre_tokenizer": {"type": "ByteLevel"},
+            "model": {"type": "BPE", "vocab": self.vocab}
+        })
+
+
+class FakeTokenizerFast:
+    def __init__(self, vocab: dict):
+        self.backend_tokenizer = FakeBackendTokenizer(vocab)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    models = {}
+    monkeypatch.setattr(registry, "_models", models)
+    return models
+
+
+def _call_with_timeout(function, timeout: float = 5.0):
+    """Call a function on a thread so that a deadlock fails the test instead of hanging it."""
+    results = []
+    thread = Thread(target=lambda: results.append(function()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{function.__name__} did not return within {timeout} seconds"
+
+    return results[0]
+
+
+def test_tokenizer_id_after_get_tokenizer(models):
+    models["tokenizer"] = FakeTokenizerFast({"a": 0, "b": 1})
+    registry.get_tokenizer()
+
+    tokenizer_id = _call_with_timeout(registry.tokenizer_id)
+
+    assert tokenizer_id.startswith("FakeTokenizer-")
+    assert _call_with_timeout(registry.tokenizer_id) == tokenizer_id
+
+
+def test_tokenizer_id_depends_on_vocab(models):
+    models["tokenizer"] = FakeTokenizerFast({"a": 0, "b": 1})
+    first = _call_with_timeout(registry.tokenizer_id)
+
+    models.clear()
+    models["tokenizer"] = FakeTokenizerFast({"a": 0, "c": 1})
+
+    assert _call_with_timeout(registry.tokenizer_id) != first
@@ -0,0 +1,133 @@
+"""Check that BatchSentimentIntensityAnalyzer scores a fixed corpus exactly like NLTK's analyzer.
+
+Needs the VADER lexicon, which nltk_downloader.py downloads; no database is used.
+"""
+from datetime import datetime
+import random
+
+import pytest
+
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+from benchmark.corpus import CorpusGenerator
+from sentiment.vader_batch import BatchSentimentIntensityAnalyzer
+
+# Texts that exercise each rule of VADER: punctuation around words, emoticons, negation, boosters,
+# capitalization, "but", "kind of", "least", idioms, repeated words and emphasis
+EDGE_CASES = [
+    "",
+    " ",
+    "a",
+    ":)",
+    ":-( :(",
+    "GME to the moon 🚀🚀🚀",
+    "This is GOOD!!!",
+    "This is good, but the earnings were terrible.",
+    "not bad at all",
+    "It isn't great... isn't it?",
+    "I kind of like it",
+    "kind of",
+    "kind",
+    "least bad option",
+    "at least it's not horrible",
+    "never so good",
+    "without a doubt the best",
+    "the shit is the bomb",
+    "cut the mustard, yeah right",
+    "good good good bad good",
+    "bad, bad. BAD! bad?",
+    "Wow!!!! this is extremely AWESOME??",
+    "'good' \"great\" (happy) [sad] {angry}",
+    "...love... ,hate, !nice! ?ugly?",
+    "no no no",
+    "Nobody knows what happens next",
+    "GME GAINS PORN! wife's boyfriend not happy",
+    "hold 💎🙌 HOLD",
+    "https://www.reddit.com/r/wallstreetbets good https://i.imgur.com/4xG2bQp.png",
+    "very very very good",
+    "barely ok, hardly good, sort of great",
+    "don't sell, DON'T SELL!!",
+    "won't lose, can't win, aint good",
+]
+
+VOCABULARY = (
+    "good great bad terrible love hate happy sad win lose gains loss moon crash tendies rich poor "
+    "not no never isn't don't can't without nor neither "
+    "very extremely barely hardly so really totally kind of sort least but however "
+    "the a is it this that my stock calls puts hold sell buy yolo apes retard bagholder "
+    ":) :( :D ;) <3 lol lmao wtf omg 🚀 💎 🙌"
+).split()
+
+PUNCTUATION = ["", "", "", "!", "?", ".", ",", "...", "!!!", "'", "\"", "(", ")"]
+
+
+def _generated_texts(count: int, seed: int = 0):
+    """Generate texts from VADER's special words, with punctuation and capitals mixed in.
+
+    :param count: The number of texts
+    :param seed: The seed of the random number generator
+    :return: A list of texts
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(1, 30)):
+            word = rng.choice(VOCABULARY)
+            if rng.random() < 0.15:
+                word = word.upper()
+            if rng.random() < 0.3:
+                word = rng.choice(PUNCTUATION) + word
+            if rng.random() < 0.3:
+                word += rng.choice(PUNCTUATION)
+            words.append(word)
+        texts.append(" ".join(words))
+
+    return texts
+
+
+def _synthetic_texts():
+    """Get the titles, bodies and comments of a small synthetic WSB corpus."""
+    corpus = CorpusGenerator(seed=0).generate(200, 10, datetime(2021, 1, 1), datetime(2021, 2, 1))
+    texts = []
+    for post in corpus:
+        texts.extend([post.title, post.selftext])
+        texts.extend(comment.body for comment in post.comments)
+
+    return texts
+
+
+@pytest.fixture(scope="module")
+def analyzers():
+    try:
+        return SentimentIntensityAnalyzer(), BatchSentimentIntensityAnalyzer()
+    except LookupError:
+        pytest.skip("The VADER lexicon is not downloaded; run nltk_downloader.py")
+
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_edge_cases_match_nltk(analyzers, text):
+    reference, batch = analyzers
+    assert batch.polarity_scores(text) == reference.polarity_scores(text)
+
+
+@pytest.mark.parametrize("name, texts", [
+    ("generated", _generated_texts(5000)),
+    ("synthetic", _synthetic_texts())
+])
+def test_corpus_matches_nltk(analyzers, name, texts):
+    reference, batch = analyzers
+
+    mismatches = [
+        text
+        for text, scores in zip(texts, batch.polarity_scores_batch(texts))
+        if scores != reference.polarity_scores(text)
+    ]
+    assert not mismatches, f"{len(mismatches)} of {len(texts)} {name} texts differ, such as {mismatches[:5]}"
+
+
+def test_batch_keeps_input_order_and_duplicates(analyzers):
+    reference, batch = analyzers
+    texts = ["good", "bad", "good", "", "bad"]
+
+    assert batch.polarity_scores_batch(texts) == [reference.polarity_scores(text) for text in texts]
@@ -0,0 +1,56 @@
+"""Check that batched VADER scoring gives the same scores as NLTK's analyzer on a sample of comments."""
+import argparse
+import os
+from time import perf_counter
+
+from dotenv import load_dotenv
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from psycopg2.pool import ThreadedConnectionPool
+
+from sentiment.comment_adder import CommentAdder
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sample", type=int, default=100000, help="The number of comments to compare on")
+    args = parser.parse_args()
+
+    pool = ThreadedConnectionPool(
+        minconn=1,
+        maxconn=2,
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        database=os.getenv("PG_DATABASE")
+    )
+
+    conn = pool.getconn()
+    cur = conn.cursor()
+    cur.execute("SELECT body FROM comments WHERE body IS NOT NULL ORDER BY RANDOM() LIMIT %s", (args.sample,))
+    texts = [row[0] for row in cur.fetchall()]
+    pool.putconn(conn)
+
+    adder = CommentAdder(pool, cache_size=None)
+    reference = SentimentIntensityAnalyzer()
+
+    start = perf_counter()
+    reference_scores = [reference.polarity_scores(text) for text in texts]
+    reference_time = perf_counter() - start
+
+    start = perf_counter()
+    batch_scores = adder.vader.polarity_scores_batch(texts)
+    batch_time = perf_counter() - start
+
+    mismatches = [text for text, a, b in zip(texts, reference_scores, batch_scores) if a != b]
+
+    print(f"Compared {len(texts)} comments, {len(mismatches)} score mismatches")
+    for text in mismatches[:10]:
+        print(f"  {text[:80]!r}")
+    print(f"NLTK: {reference_time:.1f}s, batched: {batch_time:.1f}s ({reference_time / batch_time:.1f}x)")
+
+    pool.closeall()
+
+
+if __name__ == "__main__":
+    main()